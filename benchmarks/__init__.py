@@ -0,0 +1,10 @@
+"""
+Benchmarks for the single pulse tools.
+
+synthetic.py writes fake single-pulse PSRFITS and PRESTO bestprof files, and
+run.py times each stage of fold2stl and lasercut on them over a range of
+sizes, writing the results as JSON:
+
+python -m benchmarks.run --nsubint=128,512,2048 --nbin=512 --output=timings.json
+
+"""
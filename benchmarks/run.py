@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+"""
+Times the stages of fold2stl and lasercut on synthetic data.
+
+Example usage:
+python -m benchmarks.run --nsubint=128,512,2048 --nbin=512 --repeat=3 --output=timings.json
+
+Each stage is run --repeat times and the fastest time is kept.  The JSON has
+one entry per data size, so the timings of a stage against nsubint (or nbin)
+give its scaling curve.
+
+"""
+
+import sys,os,time
+import json
+import platform
+import shutil
+import tempfile
+from optparse import OptionParser
+import numpy
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import psrfits
+import resample
+import pipeline
+import decimate
+import stlwriter
+import fold2stl
+import lasercut
+from benchmarks import synthetic
+
+_version_=0.1
+
+######################################################################
+class _Quiet():
+    """
+    with _Quiet():
+    hides what the stages print
+    """
+    def __enter__(self):
+        self.stdout=sys.stdout
+        sys.stdout=open(os.devnull,'w')
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout=self.stdout
+
+######################################################################
+def timeit(function, repeat=1):
+    """
+    seconds,result=timeit(function, repeat=1)
+    fastest wall time of repeat calls to function(), and the result of the last one
+    """
+    best=numpy.inf
+    for i in xrange(repeat):
+        with _Quiet():
+            start=time.time()
+            result=function()
+            best=min(best,time.time()-start)
+    return best,result
+
+######################################################################
+def benchfold2stl(filename, outdir, size=2, smooth=1, max_error=0.01, repeat=1):
+    """
+    stages=benchfold2stl(filename, outdir, size=2, smooth=1, max_error=0.01, repeat=1)
+    seconds for each stage of fold2stl, and for the whole of it
+    """
+    stages={}
+    reader=psrfits.SubintReader(filename)
+    n=reader.nsubint
+
+    def decode():
+        return reader.table.data[:n]['DATA'].reshape((n,-1)).astype(numpy.float32)
+    stages['decode'],raw=timeit(decode, repeat)
+
+    # scaling, weighting, dedispersing and summing channels and polarizations
+    stages['scale'],data=timeit(lambda: reader.read(stop=n), repeat)
+    data=(data-data.min())/(data.max()-data.min())
+
+    stages['resize'],data=timeit(lambda: resample.resize(data, float(size)), repeat)
+    stages['smooth'],data=timeit(lambda: pipeline.gaussian(data, smooth), repeat)
+    stages['peak'],phasemax=timeit(lambda: numpy.argmax(data.mean(axis=0))/float(data.shape[1]), repeat)
+    stages['mesh'],mesh=timeit(lambda: decimate.triangulate(data, max_error*data.ptp()), repeat)
+    stlfile=os.path.join(outdir,'bench.stl')
+    stages['stl'],ntriangles=timeit(lambda: stlwriter.heightmap2stl(data, stlfile), repeat)
+    stages['stl_decimated'],ntriangles=timeit(lambda: stlwriter.heightmap2stl(data, stlfile, max_error=max_error),
+                                              repeat)
+    reader.close()
+
+    copy=os.path.join(outdir,'fold2stl.fits')
+    shutil.copy(filename,copy)
+    stages['fold2stl'],outfile=timeit(lambda: fold2stl.fold2stl(copy, size=size, smooth=smooth), repeat)
+    return stages
+
+######################################################################
+def benchlasercut(filename, bestprof, outdir, size=3.72, nplaques=6, repeat=1):
+    """
+    stages=benchlasercut(filename, bestprof, outdir, size=3.72, nplaques=6, repeat=1)
+    seconds for plotprofile on filename, and for addplaque and save on a sheet of nplaques plaques
+    """
+    stages={}
+    copy=os.path.join(outdir,'plotprofile.fits')
+    shutil.copy(filename,copy)
+
+    def plotprofile():
+        sheet=lasercut.LaserCutSheet(24, 48, 'acrylic', 0.125)
+        sheet.plotprofile(copy, size)
+    stages['plotprofile'],result=timeit(plotprofile, repeat)
+
+    sheet=lasercut.LaserCutSheet(24, 18, 'acrylic', 0.125)
+    def addplaque():
+        sheet.clear()
+        for i in xrange(nplaques):
+            sheet.addplaque(bestprof, 'PSR J0000+0000', '1.0', '10', 'May 5, 2016',
+                            'Benchmark', 'UW Milwaukee', 'GBNCC', row=(i/3)%2, col=i%3)
+    stages['addplaque'],result=timeit(addplaque, repeat)
+
+    pdffile=os.path.join(outdir,'plaques.pdf')
+    stages['save']=numpy.inf
+    for i in xrange(repeat):
+        # start from freshly added plaques each time
+        timeit(addplaque)
+        stages['save']=min(stages['save'],timeit(lambda: sheet.save(pdffile))[0])
+    return stages
+
+######################################################################
+def benchmark(nsubints=(128,512,2048), nbins=(512,), nchan=1, npol=1, repeat=1, lasercutmax=2048):
+    """
+    results=benchmark(nsubints=(128,512,2048), nbins=(512,), nchan=1, npol=1, repeat=1, lasercutmax=2048)
+    runs the benchmarks on synthetic data of each size
+    lasercut is only run up to lasercutmax subints, as it writes a sheet per 55 pulses
+    """
+    outdir=tempfile.mkdtemp(prefix='singlepulse_bench')
+    results={'version': _version_,
+             'python': platform.python_version(),
+             'numpy': numpy.__version__,
+             'platform': platform.platform(),
+             'repeat': repeat,
+             'runs': []}
+    try:
+        bestprof=os.path.join(outdir,'bench.bestprof')
+        synthetic.makebestprof(bestprof)
+        for nbin in nbins:
+            for nsubint in nsubints:
+                filename=os.path.join(outdir,'bench.fits')
+                synthetic.makepsrfits(filename, nsubint=nsubint, nbin=nbin, nchan=nchan, npol=npol)
+                run={'nsubint': nsubint,
+                     'nbin': nbin,
+                     'nchan': nchan,
+                     'npol': npol,
+                     'filesize': os.path.getsize(filename)}
+                sys.stderr.write('nsubint=%d nbin=%d\n' % (nsubint,nbin))
+                run['stages']=benchfold2stl(filename, outdir, repeat=repeat)
+                if nsubint <= lasercutmax:
+                    run['stages'].update(benchlasercut(filename, bestprof, outdir, repeat=repeat))
+                results['runs'].append(run)
+    finally:
+        shutil.rmtree(outdir)
+    return results
+
+######################################################################
+def _ints(s):
+    return [int(x) for x in s.split(',')]
+
+######################################################################
+def main():
+
+    usage="Usage: %prog [options]\n"
+    parser = OptionParser(usage=usage,version=_version_)
+
+    parser.add_option('--nsubint',dest='nsubint',default='128,512,2048',
+                      type='str',
+                      help='Comma-separated numbers of subints [default=%default]')
+    parser.add_option('--nbin',dest='nbin',default='512',
+                      type='str',
+                      help='Comma-separated numbers of phase bins [default=%default]')
+    parser.add_option('--nchan',dest='nchan',default=1,
+                      type=int,
+                      help='Number of channels [default=%default]')
+    parser.add_option('--npol',dest='npol',default=1,
+                      type=int,
+                      help='Number of polarizations [default=%default]')
+    parser.add_option('--repeat',dest='repeat',default=1,
+                      type=int,
+                      help='Times to run each stage, keeping the fastest [default=%default]')
+    parser.add_option('--lasercutmax',dest='lasercutmax',default=2048,
+                      type=int,
+                      help='Largest nsubint to run the lasercut stages on [default=%default]')
+    parser.add_option('--output',dest='output',default=None,
+                      type='str',
+                      help='JSON file to write (default is stdout)')
+
+    (options, args) = parser.parse_args()
+    results=benchmark(nsubints=_ints(options.nsubint),
+                      nbins=_ints(options.nbin),
+                      nchan=options.nchan,
+                      npol=options.npol,
+                      repeat=options.repeat,
+                      lasercutmax=options.lasercutmax)
+    if options.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
+    else:
+        fh=open(options.output,'w')
+        json.dump(results, fh, indent=2, sort_keys=True)
+        fh.close()
+
+######################################################################
+
+if __name__=="__main__":
+    main()
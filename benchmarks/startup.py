@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+Times how long the tools take to start, and which heavy modules they import.
+
+Example usage:
+python -m benchmarks.startup --repeat=5 --max=0.5 --output=startup.json
+
+Each command is run in a fresh interpreter --repeat times and the fastest time
+is kept.  With --max, the exit status is 1 if any command is slower than that,
+or if importing one of the modules pulls in astropy, scipy, PIL or matplotlib.
+
+"""
+
+import sys,os,time
+import json
+import subprocess
+from optparse import OptionParser
+
+_version_=0.1
+
+root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# too slow to load at startup
+heavy=['astropy','scipy','PIL','matplotlib','stl_tools']
+
+# tools to start, and modules to import
+commands=[('fold2stl --help', [os.path.join(root,'fold2stl.py'),'--help'])]
+modules=['fold2stl','lasercut','psrfits','pipeline','stlwriter','vectorwriter','toolpath']
+
+######################################################################
+def _run(args):
+    env=dict(os.environ)
+    env['PYTHONPATH']=root+os.pathsep+env.get('PYTHONPATH','')
+    fh=open(os.devnull,'w')
+    start=time.time()
+    subprocess.check_call([sys.executable]+args, stdout=fh, env=env)
+    elapsed=time.time()-start
+    fh.close()
+    return elapsed
+
+######################################################################
+def imported(module):
+    """
+    names=imported(module)
+    heavy modules loaded by importing module in a fresh interpreter
+    """
+    env=dict(os.environ)
+    env['PYTHONPATH']=root+os.pathsep+env.get('PYTHONPATH','')
+    code='import sys,%s; print " ".join(sorted(set([m.split(".")[0] for m in sys.modules if m.split(".")[0] in %r])))' % (module,heavy)
+    return subprocess.check_output([sys.executable,'-c',code], env=env).split()
+
+######################################################################
+def startup(repeat=5):
+    """
+    results=startup(repeat=5)
+    fastest start time of each command and import, and the heavy modules each import loads
+    """
+    results={'python': sys.version.split()[0],
+             'repeat': repeat,
+             'baseline': min([_run(['-c','pass']) for i in xrange(repeat)]),
+             'commands': {},
+             'imports': {}}
+    for name,args in commands:
+        results['commands'][name]=min([_run(args) for i in xrange(repeat)])
+    for module in modules:
+        results['imports'][module]={'seconds': min([_run(['-c','import %s' % module]) for i in xrange(repeat)]),
+                                    'heavy': imported(module)}
+    return results
+
+######################################################################
+def main():
+
+    usage="Usage: %prog [options]\n"
+    parser = OptionParser(usage=usage,version=_version_)
+
+    parser.add_option('--repeat',dest='repeat',default=5,
+                      type=int,
+                      help='Times to run each command, keeping the fastest [default=%default]')
+    parser.add_option('--max',dest='max',default=None,
+                      type=float,
+                      help='Fail if any command or import takes longer than this many seconds')
+    parser.add_option('--output',dest='output',default=None,
+                      type='str',
+                      help='JSON file to write (default is stdout)')
+
+    (options, args) = parser.parse_args()
+    results=startup(repeat=options.repeat)
+    if options.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
+    else:
+        fh=open(options.output,'w')
+        json.dump(results, fh, indent=2, sort_keys=True)
+        fh.close()
+
+    if options.max is not None:
+        failed=False
+        times=results['commands'].items()+[(m,r['seconds']) for m,r in results['imports'].items()]
+        for name,seconds in times:
+            if seconds > options.max:
+                sys.stderr.write('%s took %.3f s (max %.3f s)\n' % (name,seconds,options.max))
+                failed=True
+        for module,r in results['imports'].items():
+            if len(r['heavy']) > 0:
+                sys.stderr.write('import %s loads %s\n' % (module,', '.join(r['heavy'])))
+                failed=True
+        if failed:
+            sys.exit(1)
+
+######################################################################
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Synthetic single pulse data for the benchmarks.
+
+synthetic.makepsrfits('fake.fits', nsubint=1024, nbin=512)
+synthetic.makebestprof('fake.bestprof', nbin=128)
+
+"""
+
+from astropy.io import fits
+import numpy
+import psrfits
+
+######################################################################
+def pulses(nsubint, nbin, nchan=1, npol=1, width=0.02, noise=0.1, seed=1):
+    """
+    data=pulses(nsubint, nbin, nchan=1, npol=1, width=0.02, noise=0.1, seed=1)
+    (nsubint,npol,nchan,nbin) Gaussian pulses at phase 0.4 with exponentially distributed
+    amplitudes, plus white noise
+    """
+    random=numpy.random.RandomState(seed)
+    phase=numpy.arange(nbin)/float(nbin)
+    profile=numpy.exp(-0.5*((phase-0.4)/width)**2).astype(numpy.float32)
+    amplitude=random.exponential(1,nsubint).astype(numpy.float32)
+    data=noise*random.randn(nsubint,npol,nchan,nbin).astype(numpy.float32)
+    data+=amplitude[:,numpy.newaxis,numpy.newaxis,numpy.newaxis]*profile
+    return data
+
+######################################################################
+def makepsrfits(filename, nsubint=1024, nbin=512, nchan=1, npol=1, seed=1, dm=26.8, period=1.0):
+    """
+    makepsrfits(filename, nsubint=1024, nbin=512, nchan=1, npol=1, seed=1, dm=26.8, period=1.0)
+    writes a PSRFITS file with a SUBINT table of 16-bit DATA, scaled per channel
+    by DAT_SCL/DAT_OFFS, and the header keywords that fold2stl and lasercut use
+    the channels are dispersed by dm, to the nearest bin
+    """
+    data=pulses(nsubint, nbin, nchan=nchan, npol=npol, seed=seed)
+    freq=350.0+numpy.linspace(-50,50,nchan,endpoint=False)+50.0/nchan
+    delay=numpy.rint(psrfits.kdm*dm*(freq**-2-350.0**-2)/period*nbin).astype(int)
+    for chan in xrange(nchan):
+        data[:,:,chan]=numpy.roll(data[:,:,chan],delay[chan],axis=-1)
+    offset=data.mean(axis=3)
+    data-=offset[...,numpy.newaxis]
+    scale=numpy.abs(data).max(axis=3)/32000.
+    scale[scale==0]=1
+    raw=numpy.round(data/scale[...,numpy.newaxis]).astype(numpy.int16)
+
+    primary=fits.PrimaryHDU()
+    for key,value in [('SRC_NAME','J0000+0000'),
+                      ('TELESCOP','GBT'),
+                      ('OBSERVER','benchmark'),
+                      ('DATE-OBS','2016-05-05T00:00:00'),
+                      ('OBSFREQ',350.0),
+                      ('OBSBW',100.0),
+                      ('OBSNCHAN',nchan),
+                      ('CHAN_DM',0.0)]:
+        primary.header[key]=value
+    columns=[fits.Column(name='TSUBINT',format='D',array=numpy.ones(nsubint)),
+             fits.Column(name='PERIOD',format='D',array=period*numpy.ones(nsubint)),
+             fits.Column(name='DAT_FREQ',format='%dD' % nchan,array=numpy.tile(freq,(nsubint,1))),
+             fits.Column(name='DAT_WTS',format='%dE' % nchan,array=numpy.ones((nsubint,nchan))),
+             fits.Column(name='DAT_OFFS',format='%dE' % (nchan*npol),array=offset.reshape((nsubint,-1))),
+             fits.Column(name='DAT_SCL',format='%dE' % (nchan*npol),array=scale.reshape((nsubint,-1))),
+             fits.Column(name='DATA',format='%dI' % (nbin*nchan*npol),dim='(%d,%d,%d)' % (nbin,nchan,npol),
+                         array=raw)]
+    table=fits.BinTableHDU.from_columns(columns,name='SUBINT')
+    for key,value in [('NBIN',nbin),('NCHAN',nchan),('NPOL',npol),('DM',dm)]:
+        table.header[key]=value
+    fits.HDUList([primary,table]).writeto(filename,overwrite=True)
+
+######################################################################
+def makebestprof(filename, nbin=128, seed=1):
+    """
+    makebestprof(filename, nbin=128, seed=1)
+    writes a PRESTO-style bestprof file (# header lines, then bin and value)
+    """
+    profile=pulses(1, nbin, noise=0.05, seed=seed).ravel()+1
+    fh=open(filename,'w')
+    fh.write('# Input file       =  %s\n' % filename)
+    fh.write('# Candidate        =  PSR_0000+0000\n')
+    fh.write('######################################################\n')
+    for i,value in enumerate(profile):
+        fh.write('%5d  %.7g\n' % (i,value))
+    fh.close()
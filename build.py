@@ -0,0 +1,128 @@
+"""
+Incremental rebuilds of sheets and meshes.
+
+A BuildManifest is a JSON file recording, for each output file, a hash of
+everything it was made from: the input files' contents, the parameters, the
+color and the pieces placed on it.  A rerun works out the hash again and only
+remakes outputs that are missing or whose hash has changed.
+
+manifest=build.BuildManifest('UWMdiscoveries.build.json')
+key=build.inputhash(build.InputFile(bestprof_file), {'size': 3.72}, 'Red')
+if not manifest.uptodate([outfile], key):
+    ... make outfile ...
+    manifest.record([outfile], key)
+manifest.save()
+
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+# bump this when the outputs change for the same inputs
+_buildversion=2
+
+######################################################################
+class InputFile():
+    """
+    f=InputFile(filename)
+    marks an argument of inputhash as a file, whose contents are hashed
+    """
+    def __init__(self, filename):
+        self.filename=filename
+
+######################################################################
+def contenthash(filename, blocksize=2**20):
+    """
+    digest=contenthash(filename, blocksize=2**20)
+    hash of the whole of a file, read blocksize bytes at a time
+    unlike pulsecache.filehash, nothing is sampled, so any change to an input is seen
+    """
+    h=hashlib.sha1()
+    fh=open(filename,'rb')
+    block=fh.read(blocksize)
+    while len(block) > 0:
+        h.update(block)
+        block=fh.read(blocksize)
+    fh.close()
+    return h.hexdigest()
+
+######################################################################
+def _canonical(value):
+    # a string that is the same for equal values, whatever the dictionary order
+    if isinstance(value,InputFile):
+        return 'file:%s' % contenthash(value.filename)
+    if isinstance(value,dict):
+        return '{%s}' % ','.join(['%r:%s' % (k,_canonical(value[k])) for k in sorted(value.keys())])
+    if isinstance(value,(list,tuple)):
+        return '[%s]' % ','.join([_canonical(v) for v in value])
+    if hasattr(value,'tolist'):
+        # numpy scalars and arrays
+        return _canonical(value.tolist())
+    return repr(value)
+
+######################################################################
+def inputhash(*parts):
+    """
+    key=inputhash(*parts)
+    hash of parts (numbers, strings, lists, dictionaries and InputFiles)
+    """
+    return hashlib.sha1('%d %s' % (_buildversion,_canonical(parts))).hexdigest()
+
+######################################################################
+class BuildManifest():
+    """
+    manifest=BuildManifest(filename)
+    manifest.uptodate(outputs, key)
+    manifest.record(outputs, key)
+    manifest.save()
+    """
+
+    def __init__(self, filename):
+        self.filename=filename
+        self.outputs={}
+        if os.path.exists(filename):
+            fh=open(filename)
+            try:
+                self.outputs=json.load(fh)
+            except ValueError:
+                # a damaged manifest just means everything is rebuilt
+                self.outputs={}
+            fh.close()
+
+    ##################################################
+    def _name(self, output):
+        return os.path.abspath(output)
+
+    ##################################################
+    def uptodate(self, outputs, key):
+        """
+        ok=manifest.uptodate(outputs, key)
+        True if every output exists and was last made from inputs with this key
+        """
+        for output in outputs:
+            if not os.path.exists(output) or self.outputs.get(self._name(output)) != key:
+                return False
+        return True
+
+    ##################################################
+    def record(self, outputs, key):
+        """
+        manifest.record(outputs, key)
+        notes that outputs were made from inputs with this key
+        """
+        for output in outputs:
+            self.outputs[self._name(output)]=key
+
+    ##################################################
+    def save(self):
+        """
+        manifest.save()
+        """
+        directory=os.path.dirname(os.path.abspath(self.filename))
+        fd,tmpname=tempfile.mkstemp(suffix='.json', dir=directory)
+        fh=os.fdopen(fd,'w')
+        json.dump(self.outputs, fh, indent=1, sort_keys=True)
+        fh.close()
+        os.rename(tmpname, self.filename)
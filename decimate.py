@@ -0,0 +1,129 @@
+"""
+Adaptive triangulation of height maps.
+
+The grid is split into a quadtree: any square block of cells whose heights all
+lie within half the tolerance of the two triangles through its corners becomes
+a single leaf, so flat or evenly sloped (off-pulse) regions collapse into a few
+large triangles while the pulses keep every pixel.
+Large leaves are fanned from their center through every vertex used along their
+edges, so there are no cracks where they meet smaller leaves.
+
+triangles,used=decimate.triangulate(data, 0.01)
+
+"""
+
+import numpy
+
+######################################################################
+def _deviation(A, s, p, q, chunksize=2**20):
+    """
+    d=_deviation(A, s, p, q, chunksize=2**20)
+    for each of the (p,q) blocks of s x s cells at the top left of A, the largest distance
+    of its vertices from the two triangles through its corners (split along the diagonal
+    that triangulate uses), about chunksize vertices at a time
+    """
+    d=numpy.empty((p,q), dtype=numpy.float32)
+    u=numpy.arange(s+1)/float(s)
+    U,V=u[:,numpy.newaxis],u[numpy.newaxis,:]
+    upper=V >= U
+    k=numpy.arange(q)[:,numpy.newaxis]*s+numpy.arange(s+1)
+    rows=max(1,chunksize/((s+1)**2*max(q,1)))
+    for start in xrange(0,p,rows):
+        stop=min(start+rows,p)
+        i=numpy.arange(start,stop)[:,numpy.newaxis]*s+numpy.arange(s+1)
+        # (rows,q,s+1,s+1) vertices of each block
+        B=numpy.asarray(A[i[:,numpy.newaxis,:,numpy.newaxis],k[numpy.newaxis,:,numpy.newaxis,:]],
+                        dtype=numpy.float32)
+        a,b=B[:,:,:1,:1],B[:,:,:1,-1:]
+        c,e=B[:,:,-1:,:1],B[:,:,-1:,-1:]
+        plane=numpy.where(upper, a+V*(b-a)+U*(e-b), a+U*(c-a)+V*(e-c))
+        d[start:stop]=numpy.abs(B-plane).max(axis=(2,3))
+    return d
+
+######################################################################
+def quadtree(A, tolerance):
+    """
+    leaves=quadtree(A, tolerance)
+    returns one (nleaves,2) array of block corners (i,k) per level,
+    where a block at level L covers 2**L x 2**L cells of A
+    a block is a leaf if every vertex is within tolerance/2 of the triangles through its
+    corners: a leaf fanned from its center is then still within tolerance everywhere
+    """
+    m,n=A.shape
+    # number of whole blocks that fit inside the grid at each level
+    shapes=[(m-1,n-1)]
+    while min(shapes[-1]) >= 2:
+        shapes.append((shapes[-1][0]/2,shapes[-1][1]/2))
+
+    leaves=[None]*len(shapes)
+    covered=numpy.zeros(shapes[-1], dtype=bool)
+    for level in xrange(len(shapes)-1,-1,-1):
+        if level==0:
+            leaf=~covered
+        else:
+            leaf=(_deviation(A, 2**level, *shapes[level]) <= 0.5*tolerance) & ~covered
+        leaves[level]=numpy.array(numpy.nonzero(leaf)).T*2**level
+        if level > 0:
+            # children of covered or leaf blocks are covered; leftover rows/columns are not
+            below=numpy.zeros(shapes[level-1], dtype=bool)
+            p,q=leaf.shape
+            below[:2*p,:2*q]=numpy.repeat(numpy.repeat(covered | leaf,2,axis=0),2,axis=1)
+            covered=below
+    return leaves
+
+######################################################################
+def triangulate(A, tolerance):
+    """
+    triangles,used=triangulate(A, tolerance)
+    triangles is a (ntriangles,3,2) array of (i,k) vertex indices into A,
+    counter-clockwise seen from above;
+    used is a boolean array marking the vertices of A that are in the mesh
+    every point of A is within tolerance of the triangulated surface
+    """
+    m,n=A.shape
+    leaves=quadtree(A, tolerance)
+
+    used=numpy.zeros((m,n), dtype=bool)
+    for level,corners in enumerate(leaves):
+        s=2**level
+        i,k=corners[:,0],corners[:,1]
+        used[i,k]=used[i+s,k]=used[i,k+s]=used[i+s,k+s]=True
+
+    triangles=[]
+    for level,corners in enumerate(leaves):
+        if len(corners)==0:
+            continue
+        s=2**level
+        i=corners[:,0,numpy.newaxis]
+        k=corners[:,1,numpy.newaxis]
+        # counter-clockwise walk around each leaf boundary
+        step=numpy.arange(s)
+        bi=numpy.c_[i+step, (i+s)+0*step, (i+s)-step, i+0*step]
+        bk=numpy.c_[k+0*step, k+step, (k+s)+0*step, (k+s)-step]
+        onedge=used[bi,bk]
+        simple=onedge.sum(axis=1)==4
+
+        # leaves with nothing but their corners: two triangles
+        i0,k0=i[simple,0],k[simple,0]
+        this=numpy.c_[i0,k0]
+        right=numpy.c_[i0,k0+s]
+        below=numpy.c_[i0+s,k0]
+        belowright=numpy.c_[i0+s,k0+s]
+        triangles.append(numpy.stack([right,this,belowright],axis=1))
+        triangles.append(numpy.stack([belowright,this,below],axis=1))
+
+        # the rest: fan from the center through every used edge vertex
+        fan=~simple
+        if fan.any():
+            bi,bk,onedge=bi[fan],bk[fan],onedge[fan]
+            leaf=numpy.nonzero(onedge)[0]
+            pi,pk=bi[onedge],bk[onedge]
+            # the next used vertex around the same leaf, wrapping to its first one
+            nxt=numpy.arange(1,len(leaf)+1)
+            last=numpy.r_[leaf[1:]!=leaf[:-1],True]
+            first=numpy.r_[True,leaf[1:]!=leaf[:-1]]
+            nxt[last]=numpy.nonzero(first)[0]
+            center=numpy.c_[i[fan,0]+s/2,k[fan,0]+s/2][leaf]
+            triangles.append(numpy.stack([center,numpy.c_[pi,pk],numpy.c_[pi[nxt],pk[nxt]]],axis=1))
+
+    return numpy.concatenate(triangles),used
@@ -1,4 +1,5 @@
 import lasercut
+import multiprocessing
 
 # dimensions in inches
 material_width=24
@@ -6,8 +7,8 @@ material_height=48
 
 filename='profiles/B0329+54.fits'
 
-for color in ['Cyan','Red','#ff7f00','Magenta','Green']:
-    sheetnum=0
-    sheet=lasercut.LaserCutSheet(material_width, material_height, 'acrylic', 0.125)
+sheet=lasercut.LaserCutSheet(material_width, material_height, 'acrylic', 0.125)
 
-    sheet.plotprofile(filename, size=3.72, color=color)
+# one pass writes every sheet in full and once per color, a sheet per process
+sheet.plotprofile(filename, size=3.72, colors=['Cyan','Red','#ff7f00','Magenta','Green'],
+                  jobs=multiprocessing.cpu_count())
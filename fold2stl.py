@@ -8,98 +8,328 @@ python fold2stl.py --phase=0.3 --height=200 --smooth=1 --subtract --tmax=500 --t
 
 
 
-from astropy.io import fits
-import sys,os
-import scipy.misc
-from stl_tools import numpy2stl
+import psrfits
+import pulsecache
+import pipeline
+import resample
+import instrument
+import build
+import sys,os,time
+import traceback
+import collections
+from stlwriter import heightmap2stl,heightmap2tiles
 import numpy
-# https://github.com/thearn/stl_tools
 from optparse import OptionParser,OptionGroup
-from scipy.ndimage import gaussian_filter
-from PIL import ImageDraw, ImageFont
-from PIL import Image
 
 _version_=0.1
 
 
 ######################################################################
-def text2array(text, fontname=None, fontsize=16):
-    if fontname is None:
-        font=ImageFont.load_default()
+# loaded fonts and rendered labels, least recently used first
+_fontcache=collections.OrderedDict()
+_textcache=collections.OrderedDict()
+_maxfonts=16
+_maxtexts=256
+
+######################################################################
+def _cached(cache, key, function, maxsize):
+    """
+    value=_cached(cache, key, function, maxsize)
+    looks key up in the OrderedDict cache, calling function() if it is missing
+    and dropping the least recently used entries beyond maxsize
+    """
+    if key in cache:
+        value=cache.pop(key)
     else:
-        try:
-            font = ImageFont.truetype(fontname, fontsize)
-        except:
-            sys.stderr.write('Unable to find font %s\n' % fontname)
-            font=ImageFont.load_default()
+        value=function()
+    cache[key]=value
+    while len(cache) > maxsize:
+        cache.popitem(last=False)
+    return value
 
-    img = Image.new('RGB', (200, 100))
-    dr = ImageDraw.Draw(img)
-    dr.text((0, 0), text, fill=(255, 0, 0), font=font)
-    text_width, text_height = dr.textsize(text, font=font)
-    img = Image.new('RGB', (text_width+10, text_height+10),(255,255,255))
+######################################################################
+def _loadfont(fontname=None, fontsize=16):
+    from PIL import ImageFont
+    if fontname is None:
+        return ImageFont.load_default()
+    try:
+        return ImageFont.truetype(fontname, fontsize)
+    except:
+        sys.stderr.write('Unable to find font %s\n' % fontname)
+        return ImageFont.load_default()
+
+######################################################################
+def _rendertext(text, fontname=None, fontsize=16):
+    from PIL import ImageDraw, Image
+    font=_cached(_fontcache, (fontname,fontsize), lambda: _loadfont(fontname, fontsize), _maxfonts)
+    # measuring does not need anything drawn
+    text_width, text_height = ImageDraw.Draw(Image.new('L', (1, 1))).textsize(text, font=font)
+    img = Image.new('L', (text_width+10, text_height+10), 255)
     dr = ImageDraw.Draw(img)
-    dr.text((5, 5), text, fill=(128, 128, 128), font=font)
-    textdata=numpy.array(img).mean(axis=2)
+    dr.text((5, 5), text, fill=128, font=font)
+    textdata=numpy.array(img, dtype=numpy.float64)
+    # shared between callers
+    textdata.flags.writeable=False
     return textdata
 
+######################################################################
+def text2array(text, fontname=None, fontsize=16):
+    """
+    textdata=text2array(text, fontname=None, fontsize=16)
+    grey text on white as a (read-only) array; fonts and labels are kept
+    between calls, so repeated labels in a batch are only rendered once
+    """
+    return _cached(_textcache, (text,fontname,fontsize),
+                   lambda: _rendertext(text, fontname=fontname, fontsize=fontsize), _maxtexts)
+
+######################################################################
+def preprocess(reader, nread=None, size=1, smooth=0, subtract=False, bins=None):
+    """
+    data=preprocess(reader, nread=None, size=1, smooth=0, subtract=False, bins=None)
+    reads the first nread subints (all if None), optionally subtracts the per-subint mean,
+    normalizes to 0-1, resizes and smooths
+    bins can be an index array of the phase bins to read, e.g. from phasewindow
+    the subints are streamed through pipeline.preprocess, so big results are memmaps
+    """
+    if nread is None:
+        nread=reader.nsubint
+    if reader.nchan > 1 or reader.npol > 1:
+        print 'Summing %d channels and %d of %d polarizations, dedispersed with DM=%g' % (reader.nchan,len(reader.pols),
+                                                                                         reader.npol,reader.dm)
+        if reader.dedispersed:
+            print '(on top of the dedispersion already applied to the file)'
+    if bins is None:
+        print 'Raw data has size (%d,%d)' % (nread,reader.nbin)
+    else:
+        print 'Raw data has size (%d,%d), reading %d bins' % (nread,reader.nbin,len(bins))
+    with instrument.stage('preprocess', file=reader.filename):
+        data=pipeline.preprocess(reader, nread=nread, size=size, smooth=smooth, subtract=subtract, bins=bins)
+    if size != 1:
+        print "Resized to (%d,%d)" % data.shape
+    return data
+
+######################################################################
+def phasewindow(reader, nread=None, phase=1, size=1, smooth=0):
+    """
+    peak,bins,keep=phasewindow(reader, nread=None, phase=1, size=1, smooth=0)
+    finds the peak bin of the mean profile of the first nread subints, streaming them once,
+    and returns the bins to read for a window of +/- phase/2 around it (in phase order,
+    wrapping around phase 0/1, with a margin for resizing and smoothing), and the columns
+    of the preprocessed bins that are inside the window
+    """
+    with instrument.stage('peak', file=reader.filename):
+        profile=pipeline.meanprofile(reader, nread=nread)
+        if smooth > 0:
+            # the same smoothing as the data gets, so the peak is found in the same place
+            from scipy import ndimage
+            profile=ndimage.gaussian_filter1d(profile, smooth/float(size), mode='wrap')
+        peak=int(numpy.argmax(profile))
+    halfwidth=phase/2.*reader.nbin
+    margin=int(numpy.ceil((4*smooth+2)/float(size)))+2
+    bins=pipeline.window(reader.nbin, peak, halfwidth+margin)
+    # phase of each preprocessed column from the peak, with columns centred on the bins they came from
+    x=(numpy.arange(int(len(bins)*size))+0.5)/size-0.5
+    offset=(x-numpy.nonzero(bins==peak)[0][0])/reader.nbin
+    return peak,bins,numpy.abs(offset)<phase/2.
+
+######################################################################
+def stlfilename(filename):
+    return os.path.splitext(filename)[0] + '.stl'
+
+######################################################################
+def tilesdirectory(filename):
+    return os.path.splitext(filename)[0] + '_tiles'
+
+######################################################################
+def stlfilenames(filename, tiles=None):
+    """
+    filenames=stlfilenames(filename, tiles=None)
+    every STL file fold2stl writes for filename, with tiles=(ntiles,mtiles) if tiled
+    """
+    if tiles is None:
+        return [stlfilename(filename)]
+    directory=tilesdirectory(filename)
+    return [os.path.join(directory,'tile_%d_%d.stl' % (a,b)) for a in xrange(tiles[0]) for b in xrange(tiles[1])]+[
+        os.path.join(directory,'keys.stl')]
+
 ######################################################################
 def fold2stl(filename, height=0.2, phase=1, size=1, smooth=0, subtract=False, tmax=None, dotext=False,
-             fontsize=16, fontname=None):
+             fontsize=16, fontname=None, max_error=None, cache=None, dm=None, top=None, minsnr=None,
+             tiles=None, tilejobs=1):
     """
     stlfile=fold2stl(filename, height=0.2, phase=1, size=1, smooth=0, subtract=False, tmax=None, dotext=False,
-             fontsize=16, fontname=None)
+             fontsize=16, fontname=None, max_error=None, cache=None, dm=None, top=None, minsnr=None,
+             tiles=None, tilejobs=1)
+    if max_error is given, flat regions of the mesh are merged to within that fraction of the height
+    cache can be a pulsecache.PulseCache to keep the preprocessed data between runs
+    channels are dedispersed with dm, or the DM in the header if it is None (see psrfits.SubintReader
+    for files that are already dedispersed)
+    with top and/or minsnr, only the top brightest pulses and/or those with S/N >= minsnr
+    are used (in time order), instead of all of them
+    with tiles=(ntiles,mtiles), the solid is cut into that many tiles along its longer and shorter
+    sides, each fitting the printer, meshed by tilejobs processes and written with their
+    alignment keys to a directory, which is returned instead
     """
     
     try:
-        f=fits.open(filename)
+        with instrument.stage('open', file=filename):
+            reader=psrfits.SubintReader(filename, dm=dm)
     except Exception,e:
         sys.stderr.write('Unable to open file %s: %s\n' % (filename,e))
         return None
     
+    # closed even if a later step fails, so batch runs do not pile up open files
+    try:
+        if top is not None or minsnr is not None:
+            nsubint=reader.nsubint
+            reader,stats=pipeline.selectsubints(reader, top=top, minsnr=minsnr)
+            print 'Selected %d of %d pulses with S/N %.1f to %.1f (%d nulls in the file)' % (reader.nsubint,nsubint,
+                                                                                            stats['snr'][reader.rows].min(),
+                                                                                            stats['snr'][reader.rows].max(),
+                                                                                            stats['null'].sum())
+        nread=None
+        if tmax is not None and tmax>0:
+            # only read the subints that survive the tmax cut after resizing, plus enough
+            # extra to keep the smoothing and the resize kernel near the cut unchanged
+            reach=resample.kernels['bilinear'][1]*max(1.0/size,1.0)
+            nread=min(int(numpy.ceil((tmax+4*smooth)/float(size)+reach))+1,reader.nsubint)
+        bins=None
+        if phase<1:
+            # find the peak first, so only the bins around it are read and processed
+            peak,bins,keep=phasewindow(reader, nread=nread, phase=phase, size=size, smooth=smooth)
+            print 'Identified pulse maximum at phase=%.2f' % (peak/float(reader.nbin))
+        if cache is None:
+            data=preprocess(reader, nread=nread, size=size, smooth=smooth, subtract=subtract, bins=bins)
+        else:
+            params={'function': 'fold2stl.preprocess',
+                    'nread': nread,
+                    'size': float(size),
+                    'smooth': float(smooth),
+                    'subtract': bool(subtract),
+                    'dm': reader.dm}
+            if top is not None or minsnr is not None:
+                params['top']=top
+                params['minsnr']=minsnr
+            if bins is not None:
+                params['bins']=[int(bins[0]),len(bins)]
+            with instrument.stage('cache', file=filename):
+                data=cache.get(filename, params)
+            if data is None:
+                data=cache.put(filename, params,
+                               preprocess(reader, nread=nread, size=size, smooth=smooth, subtract=subtract, bins=bins))
+            else:
+                print 'Using cached data of size (%d,%d)' % data.shape
+        if phase<1:
+            data=data[:,keep]
+            print 'Restricted to phase window +/- %.2f around max; size is now %s' % (phase/2,data.shape)
+        else:
+            with instrument.stage('peak', file=filename):
+                summeddata=data.mean(axis=0)
+                x=numpy.linspace(0,1,len(summeddata))
+                phasemax=x[summeddata==summeddata.max()]
+            print 'Identified pulse maximum at phase=%.2f' % phasemax
+        outfile=stlfilename(filename)
 
-    rawdata=(f[-1].data['DATA'].squeeze().T*f[-1].data['DAT_SCL']+f[-1].data['DAT_OFFS']).T
-    if subtract:
-        background=rawdata.mean(axis=1)
-        rawdata=(rawdata.T-background).T
+        if tmax is not None and tmax>0:
+            data=data[:tmax]
 
-    rawdata=(rawdata-rawdata.min())/(rawdata.max()-rawdata.min())
-    
-    print 'Raw data has size (%d,%d)' % rawdata.shape
-    if size != 1:
-        data=scipy.misc.imresize(rawdata, float(size)).astype(rawdata.dtype)
-        print "Resized to (%d,%d)" % data.shape
-    else:
-        data=rawdata
-    if smooth>0:
-        data=gaussian_filter(data, smooth)
-    summeddata=data.mean(axis=0)
-    x=numpy.linspace(0,1,len(summeddata))
-    phasemax=x[summeddata==summeddata.max()]
-    print 'Identified pulse maximum at phase=%.2f' % phasemax
-    if phase<1:
-        data=data[:,numpy.abs(x-phasemax)<phase/2]
-        print 'Restricted to phase window +/- %.2f around max; size is now %s' % (phase/2,data.shape)
-    outfile=os.path.splitext(filename)[0] + '.stl'
-
-    if tmax is not None and tmax>0:
-        data=data[:tmax]
-
-
-    if dotext:
-        text='Source: %s\nTelescope: %s\nObserver: %s\nDate: %s' % (f[0].header['SRC_NAME'],
-                                                                    f[0].header['TELESCOP'],
-                                                                    f[0].header['OBSERVER'],
-                                                                    f[0].header['DATE-OBS'].split('T')[0])    
-        textarray=text2array(text, fontsize=fontsize, fontname=fontname)/255
-        data[:textarray.shape[1],:textarray.shape[0]]*=numpy.fliplr(textarray.T)
+
+        if dotext:
+            text='Source: %s\nTelescope: %s\nObserver: %s\nDate: %s' % (reader.header['SRC_NAME'],
+                                                                        reader.header['TELESCOP'],
+                                                                        reader.header['OBSERVER'],
+                                                                        reader.header['DATE-OBS'].split('T')[0])    
+            with instrument.stage('text', file=filename):
+                textarray=text2array(text, fontsize=fontsize, fontname=fontname)/255
+                if not data.flags.writeable:
+                    # cached data is read-only: copy it a chunk at a time to an array (or
+                    # memmap, if it is big) that can be written, rather than all into memory
+                    copy=pipeline._empty(data.shape)
+                    for start in xrange(0,data.shape[0],4096):
+                        copy[start:start+4096]=data[start:start+4096]
+                    data=copy
+                data[:textarray.shape[1],:textarray.shape[0]]*=numpy.fliplr(textarray.T)
+    finally:
+        reader.close()
     
+    if tiles is not None:
+        outfile=tilesdirectory(filename)
+        with instrument.stage('tiles', file=outfile):
+            filenames=heightmap2tiles(data, outfile, tiles=tiles, scale=height, max_error=max_error, jobs=tilejobs)
+        print 'Wrote %d tiles and their keys to %s' % (len(filenames)-1,outfile)
+        return outfile
     if os.path.exists(outfile):
         os.remove(outfile)
-    numpy2stl(data, outfile, scale=height, solid=True)
+    with instrument.stage('stl', file=outfile):
+        ntriangles=heightmap2stl(data, outfile, scale=height, max_error=max_error)
+    if max_error is not None:
+        m,n=data.shape
+        # top surface plus walls and base around the perimeter
+        full=2*(m-1)*(n-1)+6*(m+n-2)
+        print 'Decimated to %d triangles (%.1f%% of full mesh)' % (ntriangles,100.0*ntriangles/full)
     print 'Wrote %s' % outfile
     return outfile
 
+######################################################################
+def _convert(job):
+    """
+    filename,outfile,elapsed,error=_convert((filename, kwargs))
+    runs fold2stl on one file, catching any failure so that a batch can carry on
+    """
+    filename,kwargs=job
+    if not os.path.exists(filename):
+        sys.stderr.write('File %s does not exist\n' % filename)
+        return filename,None,0.0,'File does not exist'
+    start=time.time()
+    outfile=None
+    error=None
+    try:
+        with instrument.stage('fold2stl', file=filename):
+            outfile=fold2stl(filename, **kwargs)
+        if outfile is None:
+            error='Unable to open file'
+    except Exception,e:
+        error='%s: %s' % (e.__class__.__name__,e)
+        sys.stderr.write('Failed on %s:\n%s' % (filename,traceback.format_exc()))
+    return filename,outfile,time.time()-start,error
+
+######################################################################
+def convertfiles(filenames, jobs=1, manifest=None, **kwargs):
+    """
+    results=convertfiles(filenames, jobs=1, manifest=None, **kwargs)
+    runs fold2stl(filename, **kwargs) on each file, using a pool of jobs processes if jobs>1
+    returns a list of (filename, outfile, elapsed, error) in the order of filenames;
+    error is None for files that succeeded
+    manifest can be a build.BuildManifest, so that files whose STL was already made
+    from the same file contents and options are skipped (with an elapsed time of 0)
+    """
+    keys={}
+    done={}
+    if manifest is not None:
+        # the cache and the number of processes only change how fast the STL is made
+        options=dict([(k,v) for k,v in kwargs.items() if not k in ('cache','tilejobs')])
+        for filename in filenames:
+            if os.path.exists(filename):
+                keys[filename]=build.inputhash('fold2stl', build.InputFile(filename), options)
+                if manifest.uptodate(stlfilenames(filename, kwargs.get('tiles')), keys[filename]):
+                    outfile=stlfilename(filename) if kwargs.get('tiles') is None else tilesdirectory(filename)
+                    done[filename]=(filename,outfile,0.0,None)
+        if len(done) > 0:
+            print 'Skipping %d files whose STL is up to date' % len(done)
+    work=[(filename,kwargs) for filename in filenames if not filename in done]
+    if jobs > 1 and len(work) > 1:
+        results=instrument.poolmap(_convert, work, min(jobs,len(work)))
+    else:
+        results=map(_convert, work)
+    if manifest is not None:
+        for filename,outfile,elapsed,error in results:
+            if error is None:
+                manifest.record(stlfilenames(filename, kwargs.get('tiles')), keys[filename])
+        manifest.save()
+    results=dict([(result[0],result) for result in results])
+    results.update(done)
+    return [results[filename] for filename in filenames]
+
 ######################################################################
 def main():
 
@@ -122,9 +352,18 @@ def main():
     parser.add_option('--subtract',dest='subtract',default=False,
                       action="store_true",
                       help='Subtract background?')
+    parser.add_option('--dm',dest='dm',default=None,
+                      type=float,
+                      help='DM to dedisperse multi-channel data with (relative to any already applied), 0 for none [default: from the header, or 0 if already dedispersed]')
     parser.add_option('--tmax',dest='tmax',default=None,
                       type=int,
                       help='Max pulse number [default=%default]')
+    parser.add_option('--top',dest='top',default=None,
+                      type=int,
+                      help='Only use the pulses with the highest S/N, this many of them')
+    parser.add_option('--minsnr',dest='minsnr',default=None,
+                      type=float,
+                      help='Only use the pulses with at least this S/N')
     parser.add_option('--text',dest='text',default=False,
                       action="store_true",
                       help='Include text?')
@@ -133,28 +372,106 @@ def main():
     parser.add_option('--fontname',dest='fontname',default=None,
                       type='str',
                       help="Font name for text")
+    parser.add_option('--decimate',dest='decimate',default=False,
+                      action="store_true",
+                      help='Merge flat regions of the mesh into larger triangles?')
+    parser.add_option('--max-error',dest='max_error',default=0.01,
+                      type=float,
+                      help='Max height error when decimating, as a fraction of the full height [default=%default]')
+    parser.add_option('--jobs',dest='jobs',default=1,
+                      type=int,
+                      help='Number of files (or with --tile, tiles) to convert in parallel [default=%default]')
+    parser.add_option('--tile',dest='tile',default=None,
+                      type='str',
+                      help='Cut the STL into WxH tiles (W along the longer side) with alignment keys, each fitting the printer')
+    parser.add_option('--cache',dest='cache',default=None,
+                      type='str',
+                      help='Directory to cache preprocessed data in')
+    parser.add_option('--cachesize',dest='cachesize',default=4096,
+                      type=float,
+                      help='Max size of the cache in MB [default=%default]')
+    parser.add_option('--manifest',dest='manifest',default=None,
+                      type='str',
+                      help='Build manifest; files whose STL is up to date according to it are skipped')
+    parser.add_option('--profile',dest='profile',default=False,
+                      action="store_true",
+                      help='Print the time and memory used by each stage?')
+    parser.add_option('--trace',dest='trace',default=None,
+                      type='str',
+                      help='Write the stages to this file in Chrome trace format')
+    parser.add_option('--report',dest='report',default=None,
+                      type='str',
+                      help='Write the stages and their totals to this JSON file')
     
     (options, args) = parser.parse_args()
     if len(args)==0:
         sys.stderr.write("Must supply >=1 FITS files\n")
         sys.exit(-1)
-    for file in args:
-        if not os.path.exists(file):
-            sys.stderr.write('File %s does not exist\n' % file)
+    if options.text and (options.fontname is not None and not os.path.exists(options.fontname)):
+        sys.stderr.write('Font file %s does not exist; will use default\n' % options.fontname)
+        options.fontname=None
+    if options.top is not None and options.top < 1:
+        sys.stderr.write('--top must be at least 1, not %d\n' % options.top)
+        sys.exit(-1)
+    cache=None
+    if options.cache is not None:
+        cache=pulsecache.PulseCache(options.cache, maxbytes=int(options.cachesize*2**20))
+    if options.profile or options.trace is not None or options.report is not None:
+        instrument.enable()
+    start=time.time()
+    manifest=None
+    if options.manifest is not None:
+        manifest=build.BuildManifest(options.manifest)
+    jobs,tilejobs=options.jobs,1
+    tiles=None
+    if options.tile is not None:
+        try:
+            tiles=tuple([int(v) for v in options.tile.lower().split('x')])
+        except ValueError:
+            tiles=()
+        if len(tiles) != 2 or min(tiles) < 1:
+            sys.stderr.write('--tile must be two whole numbers like 3x2, not %s\n' % options.tile)
             sys.exit(-1)
-        if options.text and (options.fontname is not None and not os.path.exists(options.fontname)):
-            sys.stderr.write('Font file %s does not exist; will use default\n' % options.fontname)
-            options.fontname=None
-        out=fold2stl(file, height=options.height,
-                     phase=options.phase,
-                     size=options.size,
-                     smooth=options.smooth,
-                     subtract=options.subtract,
-                     tmax=options.tmax,
-                     dotext=options.text,
-                     fontsize=options.fontsize,
-                     fontname=options.fontname)
-        
+        # the tiles of each file are meshed in parallel instead of the files
+        jobs,tilejobs=1,options.jobs
+    results=convertfiles(args, jobs=jobs,
+                         manifest=manifest,
+                         tiles=tiles,
+                         tilejobs=tilejobs,
+                         cache=cache,
+                         height=options.height,
+                         phase=options.phase,
+                         size=options.size,
+                         smooth=options.smooth,
+                         subtract=options.subtract,
+                         dm=options.dm,
+                         tmax=options.tmax,
+                         top=options.top,
+                         minsnr=options.minsnr,
+                         dotext=options.text,
+                         fontsize=options.fontsize,
+                         fontname=options.fontname,
+                         max_error=options.max_error if options.decimate else None)
+
+    print 'Summary:'
+    nfailed=0
+    for filename,outfile,elapsed,error in results:
+        if error is None:
+            print '  OK     %s -> %s (%.1f s)' % (filename,outfile,elapsed)
+        else:
+            print '  FAILED %s: %s (%.1f s)' % (filename,error,elapsed)
+            nfailed+=1
+    print '%d/%d files converted in %.1f s' % (len(results)-nfailed,len(results),time.time()-start)
+    if options.profile:
+        instrument.report(sys.stdout)
+    if options.trace is not None:
+        instrument.writetrace(options.trace)
+        print 'Wrote %s' % options.trace
+    if options.report is not None:
+        instrument.writejson(options.report)
+        print 'Wrote %s' % options.report
+    if nfailed > 0:
+        sys.exit(1)
         
 ######################################################################
 
@@ -0,0 +1,300 @@
+"""
+Opt-in timing and memory records for the stages of a run.
+
+Nothing is recorded until enable() is called; until then stage() hands back a
+context that does nothing.  Once enabled, each stage records its wall time,
+CPU time and the process's peak memory, and the records can be printed as a
+summary, written as JSON, or written in the Chrome trace format (open it in
+chrome://tracing or https://ui.perfetto.dev).
+
+instrument.enable()
+with instrument.stage('resize', file=filename):
+    data=resample.resize(data, 2.0)
+instrument.report()
+instrument.writetrace('run.trace.json')
+
+poolmap() runs a function in a pool of forked processes and merges the stages
+they record into this one's:
+
+results=instrument.poolmap(worker, jobs, 4, {'data': data})
+
+"""
+
+import sys,os,time
+import json
+import resource
+import threading
+import multiprocessing
+
+# scale of ru_maxrss to bytes
+if sys.platform=='darwin':
+    _rssunit=1
+else:
+    _rssunit=1024
+
+######################################################################
+def _peakmemory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*_rssunit
+
+######################################################################
+def _cputime():
+    t=os.times()
+    return t[0]+t[1]
+
+######################################################################
+class _NullStage():
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return False
+
+_nullstage=_NullStage()
+
+######################################################################
+class Stage():
+    """
+    with Stage(recorder, name, **args):
+    records one event in recorder when the block finishes
+    """
+
+    def __init__(self, recorder, name, **args):
+        self.recorder=recorder
+        self.name=name
+        self.args=args
+
+    def __enter__(self):
+        self.peak=_peakmemory()
+        self.cpu=_cputime()
+        self.start=time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        end=time.time()
+        peak=_peakmemory()
+        event={'name': self.name,
+               'start': self.start,
+               'wall': end-self.start,
+               'cpu': _cputime()-self.cpu,
+               'peak': peak,
+               'grew': peak-self.peak,
+               'pid': os.getpid(),
+               'tid': threading.current_thread().ident,
+               'args': self.args}
+        if type is not None:
+            event['error']='%s: %s' % (type.__name__,value)
+        self.recorder.add(event)
+        return False
+
+######################################################################
+class Recorder():
+    """
+    r=Recorder()
+    with r.stage(name, **args):
+    r.events is the list of finished stages, each a dictionary of
+    name, start, wall and cpu (seconds), peak and grew (bytes: the process's peak
+    memory after the stage and how much the stage raised it), pid, tid and args
+    """
+
+    def __init__(self):
+        self.events=[]
+        self.callbacks=[]
+        self.lock=threading.Lock()
+
+    ##################################################
+    def stage(self, name, **args):
+        return Stage(self, name, **args)
+
+    ##################################################
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+        for callback in self.callbacks:
+            callback(event)
+
+    ##################################################
+    def merge(self, events):
+        """
+        r.merge(events)
+        adds events recorded elsewhere, e.g. in worker processes
+        """
+        for event in events:
+            self.add(event)
+
+    ##################################################
+    def summary(self):
+        """
+        rows=r.summary()
+        (name, calls, wall, cpu, peak) for each stage name, in order of first use
+        """
+        rows={}
+        order=[]
+        for event in self.events:
+            if not event['name'] in rows:
+                rows[event['name']]=[event['name'],0,0.0,0.0,0]
+                order.append(event['name'])
+            row=rows[event['name']]
+            row[1]+=1
+            row[2]+=event['wall']
+            row[3]+=event['cpu']
+            row[4]=max(row[4],event['peak'])
+        return [tuple(rows[name]) for name in order]
+
+    ##################################################
+    def report(self, stream=None):
+        """
+        r.report(stream=None)
+        prints the summary (to stderr by default)
+        """
+        if stream is None:
+            stream=sys.stderr
+        stream.write('%-20s %6s %10s %10s %10s\n' % ('Stage','Calls','Wall (s)','CPU (s)','Peak (MB)'))
+        for name,calls,wall,cpu,peak in self.summary():
+            stream.write('%-20s %6d %10.3f %10.3f %10.1f\n' % (name,calls,wall,cpu,peak/2.0**20))
+
+    ##################################################
+    def writejson(self, filename):
+        """
+        r.writejson(filename)
+        writes the summary and every event
+        """
+        out={'summary': [dict(zip(('name','calls','wall','cpu','peak'),row)) for row in self.summary()],
+             'events': self.events}
+        fh=open(filename,'w')
+        json.dump(out, fh, indent=1, sort_keys=True, default=str)
+        fh.close()
+
+    ##################################################
+    def writetrace(self, filename):
+        """
+        r.writetrace(filename)
+        writes the events in the Chrome trace event format
+        """
+        if len(self.events)==0:
+            t0=0
+        else:
+            t0=min([event['start'] for event in self.events])
+        trace=[]
+        for event in self.events:
+            args=dict(event['args'])
+            args['cpu_s']=event['cpu']
+            args['peak_mb']=event['peak']/2.0**20
+            args['grew_mb']=event['grew']/2.0**20
+            if 'error' in event:
+                args['error']=event['error']
+            trace.append({'name': event['name'],
+                          'ph': 'X',
+                          'ts': 1e6*(event['start']-t0),
+                          'dur': 1e6*event['wall'],
+                          'pid': event['pid'],
+                          'tid': event['tid'],
+                          'args': args})
+        fh=open(filename,'w')
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, fh, default=str)
+        fh.close()
+
+# the recorder stage() uses, if enabled
+recorder=None
+
+######################################################################
+def enable(callback=None):
+    """
+    r=enable(callback=None)
+    starts recording; callback(event) is called as each stage finishes
+    """
+    global recorder
+    if recorder is None:
+        recorder=Recorder()
+    if callback is not None:
+        recorder.callbacks.append(callback)
+    return recorder
+
+######################################################################
+def disable():
+    """
+    r=disable()
+    stops recording and returns what was recorded
+    """
+    global recorder
+    r=recorder
+    recorder=None
+    return r
+
+######################################################################
+def enabled():
+    return recorder is not None
+
+######################################################################
+def stage(name, **args):
+    """
+    with stage(name, **args):
+    records the block as a stage if recording is enabled
+    args (e.g. file=filename) are kept with the event
+    """
+    if recorder is None:
+        return _nullstage
+    return recorder.stage(name, **args)
+
+######################################################################
+def report(stream=None):
+    if recorder is not None:
+        recorder.report(stream)
+
+######################################################################
+def writejson(filename):
+    if recorder is not None:
+        recorder.writejson(filename)
+
+######################################################################
+def writetrace(filename):
+    if recorder is not None:
+        recorder.writetrace(filename)
+
+######################################################################
+# what the workers of poolmap() were forked with
+shared={}
+
+def _initworker(profile, data):
+    # a fresh recorder, so events from before the fork are not sent back twice
+    disable()
+    if profile:
+        enable()
+    shared.clear()
+    shared.update(data)
+
+######################################################################
+def takeevents():
+    """
+    events=takeevents()
+    the events recorded so far in this process, which are then forgotten
+    """
+    if recorder is None:
+        return []
+    events=recorder.events
+    recorder.events=[]
+    return events
+
+def _runworker(job):
+    function,job=job
+    result=function(job)
+    return result,takeevents()
+
+######################################################################
+def poolmap(function, jobs, processes, data=None):
+    """
+    results=poolmap(function, jobs, processes, data=None)
+    [function(job) for job in jobs], run by a pool of processes, merging the stages they record
+    the workers are forked with the dictionary data (as instrument.shared), so big arrays
+    (in memory or memory-mapped) are shared rather than copied to each one
+    function must be defined at the top level of a module
+    """
+    pool=multiprocessing.Pool(processes, initializer=_initworker, initargs=(enabled(), data or {}))
+    try:
+        results=[]
+        for result,events in pool.map(_runworker, [(function,job) for job in jobs], chunksize=1):
+            results.append(result)
+            if recorder is not None:
+                recorder.merge(events)
+    finally:
+        pool.close()
+        pool.join()
+    return results
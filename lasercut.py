@@ -1,10 +1,12 @@
-from astropy.io import fits
-import matplotlib as mpl,matplotlib.pyplot as plt
 import sys,os
-import scipy.misc
-from scipy.ndimage import gaussian_filter
+import psrfits
+import pipeline
 import numpy
-from basic_units import cm, inch
+import vectorwriter
+import toolpath
+import instrument
+import units as _units
+import build
 
 ##################################################
 # colors used by the UWM RP lab laser cutters
@@ -45,6 +47,49 @@ cutcolor={'chipboard': {0.03125: 'Red',
                       0.25: 'Yellow',
                       0.375: 'Blue'}}
 
+# plotprofile resizes the pulses by this much
+profileresize=2.0
+
+##################################################
+def loadpulses(file, smooth=2, rows=None):
+    """
+    data=loadpulses(file, smooth=2, rows=None)
+    pulse stack from a PSRFITS file, scaled to 0-1, resized by profileresize and smoothed in phase
+    rows can be the indices of the subints to use, e.g. from pipeline.select
+    the subints are streamed, so long archives come back as memmaps
+    """
+    reader=psrfits.SubintReader(file)
+    if rows is not None:
+        reader=pipeline.Selection(reader, rows)
+    data=pipeline.preprocess(reader, size=profileresize, smooth=(0,smooth))
+    reader.close()
+    return data
+
+##################################################
+def loadbestprof(bestprof):
+    """
+    xd,yd=loadbestprof(bestprof)
+    profile from a PRESTO bestprof file, scaled to 0-1 with the peak in the middle
+    """
+    with instrument.stage('bestprof', file=bestprof):
+        xd,yd=numpy.loadtxt(bestprof,unpack=True)
+    xd=(xd-xd.min())/(xd.max()-xd.min())
+    yd=(yd-yd.min())/(yd.max()-yd.min())
+
+    id=numpy.where(yd==yd.max())[0][0]
+    yd=numpy.roll(yd,len(yd)/2-id)
+    return xd,yd
+
+##################################################
+def _profilesheetworker(job):
+    """
+    filenames=_profilesheetworker((j, start))
+    writes one sheet in a plotprofile worker, forked with the sheet, the pulses and the options
+    """
+    j,start=job
+    worker=instrument.shared
+    return worker['sheet'].profilesheet(worker['data'], j, start, **worker['kwargs'])
+
 ##################################################
 # class Colorset()
 # deals with the appropriate colors for laser cutting
@@ -80,36 +125,270 @@ class Colorset():
 # 
 # addplaque() makes discovery plaques identify who discovered a pulsar
 #   sheet.addplaque(bestprof, pulsarname, P, DM, date, studentname, studentinstitution, telescope)
+# bestprof is a file name, or the (xd, yd) from loadbestprof() to reuse a profile
 # 
 # plotprofile() plots each individual pulse separately for cutting
 #   sheet.plotprofile(psrfits, size)
 #
 # both methods can take a color as a named argument
 # this will output a PDF of only a single color at a time (useful for layering)
+#
+# the pieces are kept as a list of drawing commands for the current sheet,
+# so one sheet can be written out once per color without redoing any work:
+#   sheet.savecolors('plaques_000', ['Red','Magenta'])
+# or for profiles:
+#   sheet.plotprofile(psrfits, size, colors=['Red','#ff7f00'])
+#
+# .pdf, .svg and .dxf files are written directly by vectorwriter;
+# backend='matplotlib' draws on a matplotlib Figure instead (and allows other formats)
+#
+# with optimize=True the paths of each color are reordered before saving
+# to cut down the time the laser head spends moving between cuts
+#
+# with shareedges=True the pieces are packed edge to edge (no padding)
+# and straight borders shared by neighboring pieces are only cut once
+#
+# with simplify set to a tolerance in inches, every cut and engrave polyline
+# is thinned out to within that tolerance before saving
+#
+# the sheet is laid out in inches, but its size and padding (0.25 in by default),
+# and the size and rcircle of plotprofile(), can be given in other units (see units.py):
+#   sheet=LaserCutSheet(600, 450, 'acrylic', 0.125, units='mm')
+#   sheet.plotprofile(psrfits, 94)
 ##################################################                
 class LaserCutSheet():
-    def __init__(self, width, height, material, thickness, padding=0.25):
-        # dimensions in inches
-        self.material_width=width
-        self.material_height=height
+    def __init__(self, width, height, material, thickness, padding=None, backend='native',
+                 optimize=False, shareedges=False, simplify=None, units='inch'):
+        # dimensions in inches from here on
+        self.units=units
+        self.material_width=_units.toinches(width, units)
+        self.material_height=_units.toinches(height, units)
+        self.shareedges=shareedges
+        if self.shareedges:
+            padding=0
+        if padding is None:
+            padding=0.25
+        else:
+            padding=_units.toinches(padding, units)
         self.padding=padding
         self.material=material
         self.thickness=thickness
+        self.backend=backend
+        self.optimize=optimize
+        self.simplify=simplify
 
         self.colors=Colorset(self.material,
                              self.thickness)
 
-        plt.clf()
-        self.figure=plt.gcf()
-        self.figure.set_size_inches([self.material_width,
-                                     self.material_height])
-        
+        # the matplotlib figure is only made if it is needed
+        self.figure=None
+        self.axes=None
+        self.clear()
+
+    ##################################################
+    def settings(self):
+        """
+        settings=sheet.settings()
+        what the sheet was made with (in inches), e.g. to tell whether outputs need remaking
+        """
+        return {'width': self.material_width,
+                'height': self.material_height,
+                'material': self.material,
+                'thickness': self.thickness,
+                'padding': self.padding,
+                'backend': self.backend,
+                'optimize': self.optimize,
+                'shareedges': self.shareedges,
+                'simplify': self.simplify}
+
+    ##################################################
+    def clear(self):
+        """
+        sheet.clear()
+        removes all of the pieces from the sheet
+        """
+        # (color, axes method, args, kwargs) for everything on the sheet;
+        # method 'lines' is a whole array of polylines drawn as one collection
+        self.elements=[]
+        # (color, artist) once the elements have been drawn
+        self.artists=None
+        # {color: (before, after)} head travel once the paths have been ordered
+        self.travel=None
+        # (before, after) length of the cuts once shared edges have been merged
+        self.cutlength=None
+        # (before, after) number of vertices once the paths have been simplified
+        self.nvertices=None
+
+    ##################################################
+    def _add(self, color, method, *args, **kwargs):
+        self.elements.append((color, method, args, kwargs))
+        self.artists=None
+        self.travel=None
+        self.cutlength=None
+        self.nvertices=None
+
+    ##################################################
+    def _paths(self, color):
+        """
+        paths,first=sheet._paths(color)
+        all the polylines of one color, and the index of the first element they came from
+        """
+        paths=[]
+        first=None
+        for n,(c,method,args,kwargs) in enumerate(self.elements):
+            if c!=color or not method in ('plot','lines'):
+                continue
+            if method=='plot':
+                paths.append(numpy.c_[args[0],args[1]])
+            else:
+                paths+=list(args[0])
+            if first is None:
+                first=n
+        return paths,first
+
+    ##################################################
+    def _replacepaths(self, paths):
+        """
+        sheet._replacepaths(paths)
+        paths is {color: list of polylines}; each color's polylines
+        become a single 'lines' element where its first one was
+        """
+        first={}
+        for color in paths:
+            first[color]=self._paths(color)[1]
+        elements=[]
+        for n,(color,method,args,kwargs) in enumerate(self.elements):
+            if color in paths and method in ('plot','lines'):
+                if first[color]==n:
+                    elements.append((color, 'lines', (paths[color],), {}))
+            else:
+                elements.append((color,method,args,kwargs))
+        self.elements=elements
+        self.artists=None
+
+    ##################################################
+    def _pathcolors(self):
+        colors=[]
+        for color,method,args,kwargs in self.elements:
+            if method in ('plot','lines') and not color in colors:
+                colors.append(color)
+        return colors
+
+    ##################################################
+    def simplifypaths(self, tolerance):
+        """
+        nvertices=sheet.simplifypaths(tolerance)
+        thins out every polyline on the sheet to within tolerance (in inches)
+        returns (before, after) total number of vertices
+        """
+        simplified={}
+        before=0
+        after=0
+        for color in self._pathcolors():
+            paths=self._paths(color)[0]
+            simplified[color]=[toolpath.simplify(p, tolerance) for p in paths]
+            before+=sum([len(p) for p in paths])
+            after+=sum([len(p) for p in simplified[color]])
+        self.nvertices=(before,after)
+        print 'Simplified paths to within %g in: %d -> %d vertices' % ((tolerance,)+self.nvertices)
+        self._replacepaths(simplified)
+        return self.nvertices
+
+    ##################################################
+    def prepare(self):
+        """
+        sheet.prepare()
+        runs whichever of simplify, shareedges and optimize are set,
+        in that order, once for whatever is on the sheet
+        """
+        if self.simplify is not None and self.nvertices is None:
+            self.simplifypaths(self.simplify)
+        if self.shareedges and self.cutlength is None:
+            self.mergeedges()
+        if self.optimize and self.travel is None:
+            self.ordertoolpaths()
+
+    ##################################################
+    def mergeedges(self):
+        """
+        cutlength=sheet.mergeedges()
+        cuts straight edges shared by neighboring pieces only once
+        returns (before, after) total length of the cuts in inches
+        """
+        paths,first=self._paths(self.colors.cut)
+        if first is None:
+            self.cutlength=(0.0,0.0)
+            return self.cutlength
+        merged=toolpath.mergeedges(paths)
+        self.cutlength=(toolpath.pathlength(paths),toolpath.pathlength(merged))
+        print 'Cut length with shared edges merged: %.1f in -> %.1f in' % self.cutlength
+        self._replacepaths({self.colors.cut: merged})
+        return self.cutlength
 
-        self.axes=plt.axes([0,0,1,1],frameon=False)
+    ##################################################
+    def ordertoolpaths(self, start=(0,0)):
+        """
+        travel=sheet.ordertoolpaths(start=(0,0))
+        puts the paths of each color in the order that needs the least head travel,
+        with holes cut before the outlines around them
+        returns {color: (before, after)} estimated travel in inches
+        """
+        travel={}
+        ordered={}
+        for color in self._pathcolors():
+            paths=self._paths(color)[0]
+            # merged edges leave open paths, so cut everything closed first
+            order,ordered[color]=toolpath.orderpaths(paths, start=start,
+                                                     closedfirst=self.cutlength is not None)
+            travel[color]=(toolpath.travel(paths, start=start),
+                           toolpath.travel(ordered[color], start=start))
+            print 'Toolpath travel for %s: %.1f in -> %.1f in' % ((color,)+travel[color])
+
+        self._replacepaths(ordered)
+        self.travel=travel
+        return self.travel
+
+    ##################################################
+    def draw(self):
+        """
+        sheet.draw()
+        makes the matplotlib artists for everything on the sheet
+        this is only redone if something has been added since the last call
+        """
+        if self.artists is not None:
+            return
+        # matplotlib is only loaded for the matplotlib backend
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        if self.figure is None:
+            # a figure of our own rather than pyplot's current one, so that
+            # sheets can be drawn side by side
+            self.figure=Figure(figsize=(self.material_width,
+                                        self.material_height))
+            FigureCanvasAgg(self.figure)
+            self.axes=self.figure.add_axes([0,0,1,1],frameon=False)
+        self.axes.cla()
         # this is just a guide    
         self.axes.plot([0,self.material_width,self.material_width,0,0],
                        [0,0,self.material_height,self.material_height,0],
-                       color='k',xunits=inch,yunits=inch)
+                       color='k')
+        self.artists=[]
+        # rescaling after every artist is most of the cost, so only do it once
+        self.axes.set_autoscale_on(False)
+        for color,method,args,kwargs in self.elements:
+            if method=='lines':
+                # many polylines drawn as one collection
+                artist=self.axes.add_collection(LineCollection(args[0], colors=color, **kwargs))
+            else:
+                artist=getattr(self.axes,method)(*args, color=color, **kwargs)
+            if isinstance(artist,list):
+                self.artists+=[(color,a) for a in artist]
+            else:
+                self.artists.append((color,artist))
+        self.axes.set_autoscale_on(True)
+        self.axes.autoscale_view()
+
     ##################################################
     def addplaque(self,
                   bestprof,
@@ -131,33 +410,31 @@ class LaserCutSheet():
         height=width
 
         if color is None or color==self.colors.cut:
-            self.axes.plot(self.padding+(self.padding+width)*col+numpy.array([0,width,width,0,0]),
-                           self.padding+(self.padding+height)*row+numpy.array([0,0,height,height,0]),
-                           color=self.colors.cut)
-        xd,yd=numpy.loadtxt(bestprof,unpack=True)
-        xd=(xd-xd.min())/(xd.max()-xd.min())
-        yd=(yd-yd.min())/(yd.max()-yd.min())
-
-        id=numpy.where(yd==yd.max())[0][0]
-        yd=numpy.roll(yd,len(yd)/2-id)
+            self._add(self.colors.cut, 'plot',
+                      self.padding+(self.padding+width)*col+numpy.array([0,width,width,0,0]),
+                      self.padding+(self.padding+height)*row+numpy.array([0,0,height,height,0]))
+        if isinstance(bestprof,basestring):
+            xd,yd=loadbestprof(bestprof)
+        else:
+            xd,yd=bestprof
 
         ystart1=self.padding+(self.padding+height)*row+0.25*(height)
         profileheight=0.5*height
 
         if color is None or color==self.colors.engrave:
-            self.axes.plot(self.padding+(self.padding+width)*col+(width)*xd,
-                           ystart1+profileheight*yd,
-                           color=self.colors.engrave)
+            self._add(self.colors.engrave, 'plot',
+                      self.padding+(self.padding+width)*col+(width)*xd,
+                      ystart1+profileheight*yd)
         if color is None or color==self.colors.lightscore:
-            self.axes.fill_between(self.padding+(self.padding+width)*col+(width)*xd,
-                                   ystart1+profileheight*yd,
-                                   ystart1+profileheight,
-                                   color=self.colors.lightscore)
+            self._add(self.colors.lightscore, 'fill_between',
+                      self.padding+(self.padding+width)*col+(width)*xd,
+                      ystart1+profileheight*yd,
+                      ystart1+profileheight)
         t=numpy.linspace(0,2*numpy.pi)
         if color is None or color==self.colors.cut:
-            self.axes.plot(self.padding+(self.padding+width)*col+width/2+0.125*numpy.cos(t),
-                           self.padding+(self.padding+height)*row+height-0.25+0.125*numpy.sin(t),
-                           color=self.colors.cut)
+            self._add(self.colors.cut, 'plot',
+                      self.padding+(self.padding+width)*col+width/2+0.125*numpy.cos(t),
+                      self.padding+(self.padding+height)*row+height-0.25+0.125*numpy.sin(t))
         
         
         pulsarname=pulsarname.replace('-','$-$')
@@ -165,112 +442,240 @@ class LaserCutSheet():
         xtext=self.padding+(self.padding+width)*col+0.02*width                       
         
         if color is None or color==self.colors.darkscore:
-            self.axes.text(xtext,
-                           self.padding+(self.padding+height)*row+0.9*height,
-                           pulsarname,
-                           verticalalignment='top',
-                           horizontalalignment='left',
-                           fontsize=fontsize2,
-                           color=self.colors.darkscore,
-                           fontname=fontname)
-            self.axes.text(xtext,
-                           self.padding+(self.padding+height)*row+0.8*height,
-                           'Period=%s ms; DM=%s pc/cc' % (P,DM),
-                           verticalalignment='top',
-                           horizontalalignment='left',
-                           fontsize=fontsize1,
-                           color=self.colors.darkscore,
-                           fontname=fontname)
-            self.axes.text(xtext,
-                           self.padding+(self.padding+height)*row+0.23*height,
-                           '%s discovery made by:' % telescope,
-                           verticalalignment='top',
-                           horizontalalignment='left',
-                           fontsize=fontsize1,
-                           color=self.colors.darkscore,
-                           fontname=fontname)
-            self.axes.text(xtext,
-                           self.padding+(self.padding+height)*row+0.18*height,
-                           '%s' % studentname,
-                           verticalalignment='top',
-                           horizontalalignment='left',
-                           fontsize=fontsize2,
-                           color=self.colors.darkscore,
-                           fontname=fontname)
-            t=self.axes.text(xtext,
-                             self.padding+(self.padding+height)*row+0.08*height,
-                             '%s, %s' % (studentinstitution,date),
-                             verticalalignment='top',
-                             horizontalalignment='left',
-                             fontsize=fontsize1,
-                             color=self.colors.darkscore,
-                             fontname=fontname)
+            for yfrac,text,fontsize in [(0.9,pulsarname,fontsize2),
+                                        (0.8,'Period=%s ms; DM=%s pc/cc' % (P,DM),fontsize1),
+                                        (0.23,'%s discovery made by:' % telescope,fontsize1),
+                                        (0.18,'%s' % studentname,fontsize2),
+                                        (0.08,'%s, %s' % (studentinstitution,date),fontsize1)]:
+                self._add(self.colors.darkscore, 'text',
+                          xtext,
+                          self.padding+(self.padding+height)*row+yfrac*height,
+                          text,
+                          verticalalignment='top',
+                          horizontalalignment='left',
+                          fontsize=fontsize,
+                          fontname=fontname)
+
+
+    ##################################################
+    def profilepieces(self, data, size, first=0, rcircle=0.125, nrows=11, ncols=5, datamax=None,
+                      rowheight=None):
+        """
+        outlines,holes,anchors=sheet.profilepieces(data, size, first=0, rcircle=0.125, nrows=11, ncols=5, datamax=None,
+                                                   rowheight=None)
+        lays out every pulse in data (one pulse per row) in a single numpy pass
+        first is the pulse number of data[0], which sets where it goes on its sheet
+        rows are rowheight (default size) plus the padding apart
+        returns
+          outlines: (npulses, nbin+3, 2) closed profile outlines
+          holes: (npulses, 2, ntheta, 2) mounting-hole circles
+          anchors: (npulses, 2) lower-left corner of each piece
+        """
+        npulses,nbin=data.shape
+        if datamax is None:
+            datamax=data.max()
+        x=numpy.arange(nbin)/float(nbin-1)
+        y=numpy.float32(data)/1.05/datamax+rcircle
 
+        if rowheight is None:
+            rowheight=size
+        slot=(first+numpy.arange(npulses)) % (nrows*ncols)
+        anchors=numpy.c_[self.padding+(slot/nrows)*(size+self.padding),
+                         self.padding+(slot%nrows)*(rowheight+self.padding)]
+
+        outlines=numpy.empty((npulses,nbin+3,2))
+        outlines[:,:,0]=size*numpy.r_[x,1,0,0]
+        outlines[:,:nbin,1]=size*y
+        outlines[:,nbin:nbin+2,1]=0
+        outlines[:,nbin+2,1]=size*y[:,0]
+        outlines+=anchors[:,numpy.newaxis,:]
+
+        theta=numpy.linspace(0,2*numpy.pi)
+        circle=rcircle*numpy.c_[numpy.cos(theta),numpy.sin(theta)]
+        centers=numpy.array([[size/6.,2*rcircle],[size-size/6.,2*rcircle]])
+        holes=(anchors[:,numpy.newaxis,numpy.newaxis,:]+
+               centers[numpy.newaxis,:,numpy.newaxis,:]+
+               circle[numpy.newaxis,numpy.newaxis,:,:])
+        return outlines,holes,anchors
 
     ##################################################
-    def plotprofile(self, file, size, rcircle=0.125, nrows=11, ncols=5, color=None, prefix='', fontsize=10,smooth=2):
+    def plotprofile(self, file, size, rcircle=0.125, nrows=11, ncols=5, color=None, prefix='', fontsize=10,smooth=2,
+                    colors=None, cache=None, jobs=1, manifest=None, top=None, minsnr=None):
+        """
+        filenames=sheet.plotprofile(file, size, rcircle=0.125, nrows=11, ncols=5, color=None, prefix='', fontsize=10,smooth=2,
+                                    colors=None, cache=None, jobs=1, manifest=None, top=None, minsnr=None)
+        writes one PDF per sheet of pulses
+        size and rcircle are in the units of the sheet
+        with top and/or minsnr, only the top brightest pulses and/or those with S/N >= minsnr
+        are cut (in time order), instead of all of them
+        if colors is a list of colors, each sheet is also written once per color
+        cache can be a pulsecache.PulseCache to keep the loaded pulses between runs
+        with jobs>1 the sheets are laid out and written by a pool of that many processes
+        manifest can be a build.BuildManifest, so that only sheets whose inputs have
+        changed are written again
+        """
+        from astropy.io import fits
+        size,rcircle=_units.convert([size,rcircle], self.units, 'inch')
         self.filename=file
         f=fits.open(file)
-        data=scipy.misc.imresize(f[-1].data['DATA'].squeeze(),2.0)
-        data=gaussian_filter(data,(0,smooth))
-        x=numpy.arange(data.shape[1])
-        x=x/float(x.max())
+        label='PSR %s: %s' % (f[0].header['SRC_NAME'],
+                              f[0].header['DATE-OBS'].split('T')[0])
+        nsubint=f[-1].header['NAXIS2']
+        f.close()
+        rows=None
+        selection={}
+        if top is not None or minsnr is not None:
+            reader=psrfits.SubintReader(file)
+            selected,stats=pipeline.selectsubints(reader, top=top, minsnr=minsnr)
+            reader.close()
+            rows=selected.rows
+            selection={'top': top, 'minsnr': minsnr}
+            print 'Selected %d of %d pulses from %s' % (len(rows),nsubint,file)
+            nsubint=len(rows)
+        npulses=int(nsubint*profileresize)
 
-        theta=numpy.linspace(0,2*numpy.pi)
-        
-        j=0
-        i=0
-        while i < data.shape[0]:
-            for col in xrange(ncols):
-                for row in xrange(nrows):
-                    try:
-                        y=numpy.float32(data[i])/1.05/data.max()+rcircle
-                        x0=self.padding+col*(size+self.padding)
-                        y0=self.padding+row*(size+self.padding)
-                        if color is None or color==self.colors.cut:
-                            self.axes.plot(x0+size*numpy.r_[x,x.max(),x.min(),x.min()],
-                                           y0+size*numpy.r_[y,0,0,y[0]],color=self.colors.cut)
-                            self.axes.plot(x0+size/6.+rcircle*numpy.cos(theta),
-                                           y0+2*rcircle+rcircle*numpy.sin(theta),
-                                           color=self.colors.cut)
-                            self.axes.plot(x0+size-size/6.+rcircle*numpy.cos(theta),
-                                           y0++2*rcircle+rcircle*numpy.sin(theta),
-                                           color=self.colors.cut)
-                        if color is None or color==self.colors.engrave:
-                            self.axes.text(x0+0.02*size,
-                                           y0+0.02*size,'%03d' % i,color=self.colors.engrave,
-                                           fontsize=fontsize)
-                        
-                        if i==0:
-                            if color is None or color==self.colors.engrave:
-                                self.axes.text(x0+0.25*size,y0+0.1*size,
-                                               'PSR %s: %s' % (f[0].header['SRC_NAME'],
-                                                               f[0].header['DATE-OBS'].split('T')[0]),
-                                               color=self.colors.engrave,
-                                               fontsize=fontsize)
-                        i+=1
-                    except:
-                        pass
-
-            if color is None:
-                self.save(os.path.join(prefix,'%s_%03d.pdf' % (os.path.splitext(self.filename)[0],
-                                                                    j)))
+        npersheet=nrows*ncols
+        sheets=list(enumerate(xrange(0, npulses, npersheet)))
+        if manifest is not None:
+            inputs=build.inputhash('plotprofile', build.InputFile(file), smooth, self.settings(),
+                                   [size, rcircle, nrows, ncols, color, fontsize, colors], selection)
+            keys={}
+            for j,start in sheets:
+                keys[j]=build.inputhash(inputs, j, start)
+            sheets=[(j,start) for j,start in sheets
+                    if not manifest.uptodate(self.profilesheetnames(j, prefix, color, colors), keys[j])]
+            print '%d of %d sheets to write for %s' % (len(sheets),len(keys),file)
+            if len(sheets)==0:
+                return []
+
+        with instrument.stage('loadpulses', file=file):
+            if cache is None:
+                data=loadpulses(file, smooth=smooth, rows=rows)
             else:
-                self.save(os.path.join(prefix,'%s_%03d_%s.pdf' % (os.path.splitext(self.filename)[0],
-                                                                    j,color)))
+                params={'function': 'lasercut.loadpulses', 'smooth': float(smooth)}
+                params.update(selection)
+                data=cache.cached(file, params, lambda: loadpulses(file, smooth=smooth, rows=rows))
+        rowheight=size
+        if self.shareedges:
+            # with no padding, the rows have to clear the tallest profile
+            rowheight=size*(1/1.05+rcircle)
+        kwargs={'size': size,
+                'rcircle': rcircle,
+                'nrows': nrows,
+                'ncols': ncols,
+                'color': color,
+                'prefix': prefix,
+                'fontsize': fontsize,
+                'colors': colors,
+                'datamax': data.max(),
+                'rowheight': rowheight,
+                'label': label}
 
-            self.axes.cla()
-            self.axes.plot([0,self.material_width,self.material_width,0,0],
-                           [0,0,self.material_height,self.material_height,0],
-                           color='k',xunits=inch,yunits=inch)
+        filenames=[]
+        if jobs > 1 and len(sheets) > 1:
+            # the workers are forked with the sheet and the pulses, so the pulses
+            # (in memory or memory-mapped) are shared rather than copied
+            for names in instrument.poolmap(_profilesheetworker, sheets, min(jobs,len(sheets)),
+                                            {'sheet': self, 'data': data, 'kwargs': kwargs}):
+                filenames+=names
+        else:
+            for j,start in sheets:
+                filenames+=self.profilesheet(data, j, start, **kwargs)
+        if manifest is not None:
+            for j,start in sheets:
+                manifest.record(self.profilesheetnames(j, prefix, color, colors), keys[j])
+            manifest.save()
+        return filenames
+
+    ##################################################
+    def profilesheetnames(self, j, prefix='', color=None, colors=None):
+        """
+        filenames=sheet.profilesheetnames(j, prefix='', color=None, colors=None)
+        the files plotprofile writes for sheet number j
+        """
+        basename=os.path.join(prefix,'%s_%03d' % (os.path.splitext(self.filename)[0],j))
+        if colors is not None:
+            return [basename + '.pdf']+['%s_%s.pdf' % (basename,c) for c in colors]
+        if color is None:
+            return [basename + '.pdf']
+        return ['%s_%s.pdf' % (basename,color)]
 
-            j+=1
+    ##################################################
+    def profilesheet(self, data, j, start, size, rcircle=0.125, nrows=11, ncols=5, color=None, prefix='',
+                     fontsize=10, colors=None, datamax=None, rowheight=None, label=None):
+        """
+        filenames=sheet.profilesheet(data, j, start, size, rcircle=0.125, nrows=11, ncols=5, color=None, prefix='',
+                                     fontsize=10, colors=None, datamax=None, rowheight=None, label=None)
+        lays out and writes sheet number j, with the pulses from data[start] on
+        label is engraved next to the first pulse of the first sheet
+        """
+        self.clear()
+        stop=min(start+nrows*ncols, data.shape[0])
+        with instrument.stage('profilepieces', file=self.filename, sheet=j):
+            outlines,holes,anchors=self.profilepieces(data[start:stop], size, first=start,
+                                                      rcircle=rcircle, nrows=nrows, ncols=ncols,
+                                                      datamax=datamax, rowheight=rowheight)
+        if color is None or color==self.colors.cut:
+            # one element (one LineCollection with matplotlib) for every cut on the sheet;
+            # the outlines and holes have different numbers of points, so it is a list
+            self._add(self.colors.cut, 'lines', list(outlines)+list(holes.reshape((-1,)+holes.shape[2:])))
+        if color is None or color==self.colors.engrave:
+            for i,(x0,y0) in enumerate(anchors):
+                self._add(self.colors.engrave, 'text',
+                          x0+0.02*size,
+                          y0+0.02*size,'%03d' % (start+i),
+                          fontsize=fontsize)
+            if start==0 and label is not None:
+                x0,y0=anchors[0]
+                self._add(self.colors.engrave, 'text',
+                          x0+0.25*size,y0+0.1*size,
+                          label,
+                          fontsize=fontsize)
 
+        if colors is not None:
+            basename=os.path.join(prefix,'%s_%03d' % (os.path.splitext(self.filename)[0],j))
+            return self.savecolors(basename, colors)
+        filename=self.profilesheetnames(j, prefix, color)[0]
+        self.save(filename)
+        return [filename]
 
+    def save(self, filename, color=None):
+        """
+        sheet.save(filename, color=None)
+        writes the sheet, or only the pieces of one color
+        """
+        with instrument.stage('prepare'):
+            self.prepare()
+        extension=os.path.splitext(filename)[1].lower()
+        with instrument.stage('save', file=filename, color=color):
+            if self.backend=='native' and extension in vectorwriter.writers:
+                vectorwriter.write(filename, self.material_width, self.material_height,
+                                   self.elements, color=color)
+                return
+            self.draw()
+            for c,artist in self.artists:
+                artist.set_visible(color is None or c==color)
+            self.axes.set_xticks([])
+            self.axes.set_yticks([])
+            self.axes.axis('off')
+            self.axes.axis('image')
+            self.figure.savefig(filename,transparent=True,facecolor='none')
 
-    def save(self, filename):
-        self.axes.set_xticks([])
-        self.axes.set_yticks([])
-        self.axes.axis('off')
-        self.axes.axis('image')
-        self.figure.savefig(filename,transparent=True,facecolor='none')
+    ##################################################
+    def savecolors(self, basename, colors=None, extension='.pdf'):
+        """
+        filenames=sheet.savecolors(basename, colors=None, extension='.pdf')
+        writes the whole sheet to basename.pdf and each color to basename_<color>.pdf
+        colors defaults to every color used on the sheet
+        """
+        if colors is None:
+            colors=[]
+            for c,method,args,kwargs in self.elements:
+                if not c in colors:
+                    colors.append(c)
+        filenames=[basename + extension]
+        self.save(filenames[0])
+        for color in colors:
+            filenames.append('%s_%s%s' % (basename,color,extension))
+            self.save(filenames[-1], color=color)
+        return filenames
@@ -0,0 +1,270 @@
+"""
+Out-of-core preprocessing of pulse stacks.
+
+The subints are read from a psrfits.SubintReader a chunk at a time:
+a first pass finds the range of the data, and a second normalizes,
+resizes and smooths them into an array that is only held in memory if it
+is small; otherwise each stage goes to a memmap in a temporary file.
+Smoothing reads a halo of extra rows around each chunk, so the result
+matches smoothing the whole array at once.
+
+r=psrfits.SubintReader('J0034-0721.rf')
+data=pipeline.preprocess(r, size=2, smooth=1)
+
+pulsestats() streams the subints once more for the on-pulse S/N, peak, off-pulse
+rms and nulling of each, so that only the brightest can be kept:
+
+r,stats=pipeline.selectsubints(r, top=200)
+
+"""
+
+import tempfile
+import numpy
+import resample
+import instrument
+
+# stages bigger than this (in bytes) go to disk
+maxmemory=2**28
+
+######################################################################
+def _empty(shape, tmpdir=None):
+    """
+    A=_empty(shape, tmpdir=None)
+    float32 array, memory-mapped to an anonymous temporary file if it is big
+    """
+    if numpy.prod(shape)*4 <= maxmemory:
+        return numpy.empty(shape, dtype=numpy.float32)
+    # the file goes away once the memmap does
+    return numpy.memmap(tempfile.TemporaryFile(dir=tmpdir), dtype=numpy.float32, mode='w+', shape=shape)
+
+######################################################################
+class _Normalized():
+    """
+    A=_Normalized(reader, nread, lo, hi, subtract=False, bins=None)
+    the first nread subints of reader (only the given phase bins, if any),
+    sliced by rows like an array and scaled to 0-1
+    """
+
+    def __init__(self, reader, nread, lo, hi, subtract=False, bins=None):
+        self.reader=reader
+        if bins is None:
+            self.shape=(nread,reader.nbin)
+        else:
+            self.shape=(nread,len(bins))
+        self.lo=lo
+        self.hi=hi
+        self.subtract=subtract
+        self.bins=bins
+
+    def __getitem__(self, rows):
+        start,stop,step=rows.indices(self.shape[0])
+        data=_read(self.reader, start, stop, self.subtract, self.bins)
+        data-=self.lo
+        data/=self.hi-self.lo
+        return data
+
+######################################################################
+def _read(reader, start, stop, subtract=False, bins=None):
+    if not subtract:
+        return reader.read(start=start, stop=stop, bins=bins)
+    # the background is the mean over every bin, not just the ones kept
+    data=reader.read(start=start, stop=stop)
+    data-=data.mean(axis=1)[:,numpy.newaxis]
+    if bins is not None:
+        data=data[:,bins]
+    return data
+
+######################################################################
+def datarange(reader, nread=None, subtract=False, chunksize=4096, bins=None):
+    """
+    lo,hi=datarange(reader, nread=None, subtract=False, chunksize=4096, bins=None)
+    min and max of the first nread subints (and the given phase bins), read chunksize subints at a time
+    """
+    if nread is None:
+        nread=reader.nsubint
+    lo,hi=numpy.inf,-numpy.inf
+    for start in xrange(0,nread,chunksize):
+        data=_read(reader, start, min(start+chunksize,nread), subtract, bins)
+        lo=min(lo,data.min())
+        hi=max(hi,data.max())
+    return lo,hi
+
+######################################################################
+def meanprofile(reader, nread=None, chunksize=4096):
+    """
+    profile=meanprofile(reader, nread=None, chunksize=4096)
+    mean over the first nread subints of every phase bin, read chunksize subints at a time
+    """
+    if nread is None:
+        nread=reader.nsubint
+    total=numpy.zeros(reader.nbin, dtype=numpy.float64)
+    for start in xrange(0,nread,chunksize):
+        total+=reader.read(start=start, stop=min(start+chunksize,nread)).sum(axis=0)
+    return total/nread
+
+######################################################################
+def window(nbin, center, halfwidth):
+    """
+    bins=window(nbin, center, halfwidth)
+    the bins within halfwidth (in bins) of center, in phase order,
+    wrapping around phase 0/1; all nbin bins (centred) if the window is wider
+    """
+    halfwidth=int(numpy.ceil(halfwidth))
+    if 2*halfwidth+1 >= nbin:
+        return (center-nbin/2+numpy.arange(nbin)) % nbin
+    return (center+numpy.arange(-halfwidth,halfwidth+1)) % nbin
+
+######################################################################
+def onpulse(profile, fraction=0.1):
+    """
+    mask=onpulse(profile, fraction=0.1)
+    the bins of a mean profile more than fraction of the way from its median up to its peak
+    """
+    baseline=numpy.median(profile)
+    mask=profile-baseline > fraction*(profile.max()-baseline)
+    mask[numpy.argmax(profile)]=True
+    return mask
+
+######################################################################
+def pulsestats(reader, nread=None, mask=None, nullsnr=3.0, chunksize=4096):
+    """
+    stats=pulsestats(reader, nread=None, mask=None, nullsnr=3.0, chunksize=4096)
+    statistics of each of the first nread subints, read chunksize subints at a time, as a record array of
+      snr:  on-pulse S/N (sum above the off-pulse mean, over rms*sqrt(on-pulse bins))
+      peak: highest on-pulse value above the off-pulse mean
+      rms:  off-pulse rms
+      null: True where snr < nullsnr
+    mask picks the on-pulse bins; by default onpulse() of the mean profile, which costs another pass
+    """
+    if nread is None:
+        nread=reader.nsubint
+    if mask is None:
+        mask=onpulse(meanprofile(reader, nread=nread, chunksize=chunksize))
+    if mask.all():
+        raise ValueError('No off-pulse bins left in %s' % reader.filename)
+    stats=numpy.zeros(nread, dtype=[('snr',numpy.float32),
+                                    ('peak',numpy.float32),
+                                    ('rms',numpy.float32),
+                                    ('null',numpy.bool_)])
+    for start in xrange(0,nread,chunksize):
+        stop=min(start+chunksize,nread)
+        data=reader.read(start=start, stop=stop)
+        off=data[:,~mask]
+        baseline=off.mean(axis=1)
+        rms=off.std(axis=1)
+        on=data[:,mask]-baseline[:,numpy.newaxis]
+        stats['rms'][start:stop]=rms
+        stats['peak'][start:stop]=on.max(axis=1)
+        # blank subints have no noise and no signal
+        stats['snr'][start:stop]=on.sum(axis=1)/numpy.where(rms > 0,rms*numpy.sqrt(mask.sum()),numpy.inf)
+    stats['null']=stats['snr'] < nullsnr
+    return stats
+
+######################################################################
+def select(stats, top=None, minsnr=None):
+    """
+    rows=select(stats, top=None, minsnr=None)
+    indices of the subints with snr >= minsnr, and of those the top brightest, in time order
+    """
+    if top is not None and top < 1:
+        raise ValueError('top must be at least 1, not %d' % top)
+    rows=numpy.arange(len(stats))
+    if minsnr is not None:
+        rows=rows[stats['snr'] >= minsnr]
+    if top is not None:
+        rows=rows[numpy.argsort(-stats['snr'][rows], kind='mergesort')[:top]]
+    return numpy.sort(rows)
+
+######################################################################
+def selectsubints(reader, top=None, minsnr=None, nullsnr=3.0, chunksize=4096):
+    """
+    selection,stats=selectsubints(reader, top=None, minsnr=None, nullsnr=3.0, chunksize=4096)
+    a Selection of the subints of reader picked by select() from their pulsestats()
+    """
+    with instrument.stage('stats', file=reader.filename):
+        stats=pulsestats(reader, nullsnr=nullsnr, chunksize=chunksize)
+    rows=select(stats, top=top, minsnr=minsnr)
+    if len(rows) == 0:
+        if minsnr is None:
+            raise ValueError('No subints in %s' % reader.filename)
+        raise ValueError('No subints of %s have S/N >= %g' % (reader.filename,minsnr))
+    return Selection(reader, rows),stats
+
+######################################################################
+class Selection():
+    """
+    r=Selection(reader, rows)
+    reads only the given subints of reader, as if they were the whole file
+    everything else is passed through to reader
+    """
+
+    def __init__(self, reader, rows):
+        self.reader=reader
+        self.rows=numpy.asarray(rows, dtype=int)
+        self.nsubint=len(self.rows)
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+    def read(self, start=0, stop=None, bins=None, dtype=numpy.float32):
+        rows=self.rows[start:stop]
+        # each run of consecutive subints is read in one go
+        breaks=numpy.nonzero(numpy.diff(rows) != 1)[0]+1
+        data=[self.reader.read(start=run[0], stop=run[-1]+1, bins=bins, dtype=dtype)
+              for run in numpy.split(rows, breaks) if len(run) > 0]
+        if len(data) == 0:
+            return self.reader.read(start=0, stop=0, bins=bins, dtype=dtype)
+        return numpy.concatenate(data)
+
+######################################################################
+def gaussian(A, sigma, out=None, chunksize=4096, tmpdir=None):
+    """
+    data=gaussian(A, sigma, out=None, chunksize=4096, tmpdir=None)
+    gaussian_filter(A, sigma) done chunksize rows at a time
+    A can be anything that gives float arrays when sliced by rows
+    """
+    from scipy.ndimage import gaussian_filter
+    sigma=numpy.ones(2)*sigma
+    if out is None:
+        out=_empty(A.shape, tmpdir)
+    # rows within this distance affect a chunk (the same cutoff gaussian_filter uses)
+    halo=int(4.0*sigma[0]+0.5)
+    m=A.shape[0]
+    for start in xrange(0,m,chunksize):
+        stop=min(start+chunksize,m)
+        first,last=max(start-halo,0),min(stop+halo,m)
+        block=gaussian_filter(numpy.asarray(A[first:last],dtype=numpy.float32), sigma)
+        out[start:stop]=block[start-first:stop-first]
+    return out
+
+######################################################################
+def preprocess(reader, nread=None, size=1, smooth=0, subtract=False, chunksize=4096, tmpdir=None, bins=None):
+    """
+    data=preprocess(reader, nread=None, size=1, smooth=0, subtract=False, chunksize=4096, tmpdir=None, bins=None)
+    reads the first nread subints (all if None), optionally subtracts the per-subint mean,
+    normalizes to 0-1, resizes by size and smooths by smooth (a number or one per axis)
+    bins can be an index array of the phase bins to keep, e.g. from window()
+    the normalization is over every subint and phase bin of reader, so heights do not
+    depend on nread or bins
+    """
+    if nread is None:
+        nread=reader.nsubint
+    with instrument.stage('range', file=reader.filename):
+        # a streaming pass, so the memory used does not grow with the file
+        lo,hi=datarange(reader, subtract=subtract, chunksize=chunksize)
+    # reading and normalizing happen inside the first of the stages below
+    data=_Normalized(reader, nread, lo, hi, subtract=subtract, bins=bins)
+    if size != 1:
+        shape=(int(nread*size),int(data.shape[1]*size))
+        with instrument.stage('resize', file=reader.filename):
+            data=resample.resize(data, float(size), out=_empty(shape, tmpdir))
+    if numpy.any(numpy.asarray(smooth)>0):
+        with instrument.stage('smooth', file=reader.filename):
+            data=gaussian(data, smooth, chunksize=chunksize, tmpdir=tmpdir)
+    elif isinstance(data,_Normalized):
+        with instrument.stage('normalize', file=reader.filename):
+            out=_empty(data.shape, tmpdir)
+            for start in xrange(0,nread,chunksize):
+                out[start:start+chunksize]=data[start:start+chunksize]
+        data=out
+    return data
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""
+Discovery plaques for a whole list of pulsars.
+
+The list is a CSV file with a header line, or a YAML list of mappings (if
+PyYAML is installed), with the columns:
+  name, student, date, telescope, period, dm, bestprof
+and optionally institution and copies.  Each bestprof is read once, the plaques
+are laid out on as many sheets as they need, and the sheets are written in
+parallel:
+
+Example usage:
+python plaques.py --prefix=UWMdiscoveries --jobs=4 discoveries.csv
+
+import plaques
+filenames=plaques.makeplaques(plaques.readmanifest('discoveries.csv'), 'UWMdiscoveries', jobs=4)
+
+"""
+
+import sys,os
+import csv
+from optparse import OptionParser
+import lasercut
+import instrument
+import build
+
+_version_=0.1
+
+# columns every entry needs
+required=['name','student','date','telescope','period','dm','bestprof']
+
+######################################################################
+def readmanifest(filename):
+    """
+    entries=readmanifest(filename)
+    reads a .csv, .yaml or .yml manifest into a list of dictionaries
+    relative bestprof paths are taken from the manifest's directory
+    """
+    extension=os.path.splitext(filename)[1].lower()
+    if extension in ('.yaml','.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('Reading %s needs PyYAML; use a CSV manifest instead' % filename)
+        fh=open(filename)
+        entries=yaml.safe_load(fh)
+        fh.close()
+    else:
+        fh=open(filename)
+        entries=[dict([(k.strip(),v.strip()) for k,v in row.items() if k is not None and v is not None])
+                 for row in csv.DictReader(fh)]
+        fh.close()
+    directory=os.path.dirname(os.path.abspath(filename))
+    for i,entry in enumerate(entries):
+        missing=[k for k in required if not k in entry]
+        if len(missing) > 0:
+            raise KeyError('Entry %d of %s is missing %s' % (i+1,filename,', '.join(missing)))
+        entry['bestprof']=os.path.join(directory,str(entry['bestprof']))
+    return entries
+
+######################################################################
+def paginate(entries, width=24, height=18, padding=0.25):
+    """
+    sheets=paginate(entries, width=24, height=18, padding=0.25)
+    a list with one list of (entry, row, col) per sheet, in manifest order
+    each entry appears copies times (default 1)
+    """
+    # plaques are squares, three across the sheet
+    size=(width-4*padding)/3.
+    nrows=int((height-padding)/(size+padding))
+    if nrows < 1:
+        raise ValueError('A %gx%g sheet is too short for a %.2f in plaque' % (width,height,size))
+    sheets=[]
+    n=0
+    for entry in entries:
+        for copy in xrange(int(entry.get('copies',1))):
+            if n % (3*nrows) == 0:
+                sheets.append([])
+            sheets[-1].append((entry,(n/3) % nrows,n % 3))
+            n+=1
+    return sheets
+
+######################################################################
+def rendersheet(basename, plaques, profiles, width=24, height=18, material='acrylic', thickness=0.125,
+                colors=None, institution='UW Milwaukee', **kwargs):
+    """
+    filenames=rendersheet(basename, plaques, profiles, width=24, height=18, material='acrylic', thickness=0.125,
+                          colors=None, institution='UW Milwaukee', **kwargs)
+    lays out one sheet of (entry, row, col) plaques and writes it in full and once per color
+    profiles is {bestprof: (xd, yd)} as from lasercut.loadbestprof
+    other keywords go to LaserCutSheet
+    """
+    sheet=lasercut.LaserCutSheet(width, height, material, thickness, **kwargs)
+    for entry,row,col in plaques:
+        sheet.addplaque(profiles[entry['bestprof']],
+                        'PSR %s' % entry['name'],
+                        str(entry['period']),
+                        str(entry['dm']),
+                        str(entry['date']),
+                        entry['student'],
+                        entry.get('institution',institution),
+                        entry['telescope'],
+                        row=row,
+                        col=col)
+    return sheet.savecolors(basename, colors)
+
+######################################################################
+def _renderworker(job):
+    """
+    filenames=_renderworker((basename, plaques))
+    rendersheet in a makeplaques worker, forked with the profiles and the options
+    """
+    basename,plaques=job
+    return rendersheet(basename, plaques, instrument.shared['profiles'], **instrument.shared['kwargs'])
+
+######################################################################
+def makeplaques(entries, prefix, width=24, height=18, jobs=1, buildmanifest=None, **kwargs):
+    """
+    filenames=makeplaques(entries, prefix, width=24, height=18, jobs=1, buildmanifest=None, **kwargs)
+    writes prefix_0.pdf, prefix_0_<color>.pdf, prefix_1.pdf, ... for the manifest entries,
+    with a pool of jobs processes if jobs>1
+    buildmanifest can be a build.BuildManifest, so that only sheets whose plaques,
+    bestprof files or settings have changed are written again
+    other keywords go to rendersheet
+    """
+    if kwargs.get('colors') is None:
+        # every color addplaque uses, in the order savecolors would find them
+        c=lasercut.Colorset(kwargs.get('material','acrylic'), kwargs.get('thickness',0.125))
+        kwargs['colors']=[]
+        for color in [c.cut,c.engrave,c.lightscore,c.darkscore]:
+            if not color in kwargs['colors']:
+                kwargs['colors'].append(color)
+    kwargs['width']=width
+    kwargs['height']=height
+    sheets=paginate(entries, width=width, height=height,
+                    padding=0 if kwargs.get('shareedges') else kwargs.get('padding',0.25))
+    work=[('%s_%d' % (prefix,i),plaques) for i,plaques in enumerate(sheets)]
+    if buildmanifest is not None:
+        keys={}
+        outputs={}
+        filehashes={}
+        for entry in entries:
+            if not entry['bestprof'] in filehashes:
+                filehashes[entry['bestprof']]=build.inputhash(build.InputFile(entry['bestprof']))
+        for basename,plaques in work:
+            keys[basename]=build.inputhash('plaques', kwargs,
+                                           [(entry,row,col,filehashes[entry['bestprof']])
+                                            for entry,row,col in plaques])
+            outputs[basename]=[basename + '.pdf']+['%s_%s.pdf' % (basename,c) for c in kwargs['colors']]
+        nsheets=len(work)
+        work=[(basename,plaques) for basename,plaques in work
+              if not buildmanifest.uptodate(outputs[basename], keys[basename])]
+        print '%d of %d sheets to write' % (len(work),nsheets)
+    # each bestprof is only read once, however many plaques use it
+    profiles={}
+    for basename,plaques in work:
+        for entry,row,col in plaques:
+            if not entry['bestprof'] in profiles:
+                profiles[entry['bestprof']]=lasercut.loadbestprof(entry['bestprof'])
+    filenames=[]
+    if jobs > 1 and len(work) > 1:
+        for names in instrument.poolmap(_renderworker, work, min(jobs,len(work)),
+                                        {'profiles': profiles, 'kwargs': kwargs}):
+            filenames+=names
+    else:
+        for basename,plaques in work:
+            filenames+=rendersheet(basename, plaques, profiles, **kwargs)
+    if buildmanifest is not None:
+        for basename,plaques in work:
+            buildmanifest.record(outputs[basename], keys[basename])
+        buildmanifest.save()
+    return filenames
+
+######################################################################
+def main():
+
+    usage="Usage: %prog [options] manifest\n"
+    parser = OptionParser(usage=usage,version=_version_)
+
+    parser.add_option('--prefix',dest='prefix',default='plaques',
+                      type='str',
+                      help='Start of the output file names [default=%default]')
+    parser.add_option('--width',dest='width',default=24,
+                      type=float,
+                      help='Sheet width in inches [default=%default]')
+    parser.add_option('--height',dest='height',default=18,
+                      type=float,
+                      help='Sheet height in inches [default=%default]')
+    parser.add_option('--material',dest='material',default='acrylic',
+                      type='str',
+                      help='Material [default=%default]')
+    parser.add_option('--thickness',dest='thickness',default=0.125,
+                      type=float,
+                      help='Material thickness in inches [default=%default]')
+    parser.add_option('--institution',dest='institution',default='UW Milwaukee',
+                      type='str',
+                      help='Institution for entries without one [default=%default]')
+    parser.add_option('--jobs',dest='jobs',default=1,
+                      type=int,
+                      help='Number of sheets to write in parallel [default=%default]')
+    parser.add_option('--incremental',dest='incremental',default=False,
+                      action="store_true",
+                      help='Only write sheets whose inputs changed since the last run (kept in <prefix>.build.json)?')
+
+    (options, args) = parser.parse_args()
+    if len(args)!=1:
+        sys.stderr.write("Must supply one manifest\n")
+        sys.exit(-1)
+    try:
+        entries=readmanifest(args[0])
+    except Exception,e:
+        sys.stderr.write('Unable to read manifest %s: %s\n' % (args[0],e))
+        sys.exit(1)
+    buildmanifest=None
+    if options.incremental:
+        buildmanifest=build.BuildManifest(options.prefix + '.build.json')
+    filenames=makeplaques(entries, options.prefix,
+                          buildmanifest=buildmanifest,
+                          width=options.width,
+                          height=options.height,
+                          material=options.material,
+                          thickness=options.thickness,
+                          institution=options.institution,
+                          jobs=options.jobs)
+    print 'Wrote %d files for %d plaques' % (len(filenames),sum([int(e.get('copies',1)) for e in entries]))
+
+######################################################################
+
+if __name__=="__main__":
+    main()
@@ -1,4 +1,5 @@
-import lasercut
+import plaques
+import datetime
 
 # dimensions in inches
 material_width=24
@@ -19,44 +20,14 @@ Data=[['J0355+28','Renee Spiewak','10/27/15','GBNCC','365','49','guppi_57379_035
 
 prefix='UWMdiscoveries'
 
-#for color in [None]:
-for color in ['Cyan','Red','Orange','Magenta','Green']:
-    sheetnum=0
-    sheet=lasercut.LaserCutSheet(material_width, material_height, 'acrylic',0.125)
-
-    row=0
-    col=0
-    for line in Data:
-        for repeat in xrange(2):
-            sheet.addplaque(line[-1],
-                            'PSR %s' % line[0],
-                            line[4],
-                            line[5],
-                            datetime.datetime.strptime(line[2],
-                                                       '%m/%d/%y').strftime('%b %-d, %Y'),
-                            line[1],
-                            'UW Milwaukee',
-                            line[3],
-                            col=col,
-                            row=row,
-                            color=color)
-            col+=1
-            if col==3:
-                row+=1
-                col=0
-
-                if row==2:
-                    if color is not None:
-                        sheet.save('%s_%d_%s.pdf' % (prefix,sheetnum,color))
-                    else:
-                        sheet.save('%s_%d.pdf' % (prefix,sheetnum))
-                    sheet=LaserCutSheet(material_width, material_height, 'acrylic',0.125)
-
-                    sheetnum+=1
-                    row=0
-                    col=0
-
-    if color is None:
-        sheet.save('%s_%d.pdf' % (prefix,sheetnum))
-    else:        
-        sheet.save('%s_%d_%s.pdf' % (prefix,sheetnum,color))
+# two of each plaque; the sheets are filled in order, written in full and once per color
+entries=[{'name': line[0],
+          'student': line[1],
+          'date': datetime.datetime.strptime(line[2],'%m/%d/%y').strftime('%b %-d, %Y'),
+          'telescope': line[3],
+          'period': line[4],
+          'dm': line[5],
+          'bestprof': line[6],
+          'copies': 2} for line in Data]
+plaques.makeplaques(entries, prefix, width=material_width, height=material_height,
+                    material='acrylic', thickness=0.125, institution='UW Milwaukee')
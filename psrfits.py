@@ -0,0 +1,161 @@
+"""
+Lazy access to the SUBINT table of PSRFITS files.
+
+The file is opened memory-mapped, so only the subintegrations (and phase bins)
+that are asked for are read from disk and scaled.  Files with several channels
+or polarizations are dedispersed (with the header DM) and summed to total
+intensity as they are read:
+
+r=psrfits.SubintReader('J0034-0721.rf')
+data=r.read(stop=500)
+
+"""
+
+import sys
+import numpy
+
+# dispersion delay constant, in s MHz^2 pc^-1 cm^3
+kdm=4.148808e3
+
+# which polarizations add up to total intensity, for each POL_TYPE
+_intensity={'AABBCRCI': [0,1],
+            'AABB': [0,1],
+            'IQUV': [0],
+            'INTEN': [0],
+            'AA+BB': [0]}
+
+######################################################################
+class SubintReader():
+    """
+    r=SubintReader(filename, dm=None, fft=False)
+    data=r.read(start=0, stop=None, bins=None, dtype=numpy.float32)
+
+    r.header is the primary header
+    r.nsubint, r.nbin give the size of the SUBINT table, and r.nchan, r.npol the channels
+    and polarizations in each subint
+    dm overrides the DM in the header (0 to not dedisperse); channels are shifted by
+    whole bins, or by fractions of a bin in the Fourier domain if fft is True
+    r.dedispersed is True if the last row of the HISTORY table has DEDISP set (e.g. after
+    pam -D); such files are not shifted again, and dm is then the DM relative to the one
+    already applied
+    """
+
+    # largest number of samples (subints*polarizations*channels*bins) converted at once
+    maxsamples=2**24
+
+    def __init__(self, filename, dm=None, fft=False):
+        # astropy is slow to import, so only load it once a file is opened
+        from astropy.io import fits
+        self.filename=filename
+        self.fits=fits.open(filename, memmap=True)
+        self.header=self.fits[0].header
+        self.table=self.fits[-1]
+        self.nsubint=self.table.header['NAXIS2']
+        first=self.table.data[:1]
+        # the last axis of DATA is always phase
+        self.nbin=self.table.header.get('NBIN',first['DATA'].shape[-1])
+        self.nchan=self.table.header.get('NCHAN',1)
+        self.npol=self.table.header.get('NPOL',1)
+        if self.nbin*self.nchan*self.npol != first['DATA'][0].size:
+            raise ValueError('DATA in %s does not have NBIN*NCHAN*NPOL=%d*%d*%d values' % (filename,self.nbin,
+                                                                                           self.nchan,self.npol))
+        poltype=str(self.table.header.get('POL_TYPE','')).strip().upper()
+        self.pols=[p for p in _intensity.get(poltype,[0,1]) if p < self.npol]
+        self.weighted='DAT_WTS' in first.names
+        self.fft=fft
+
+        # the last row of HISTORY describes the file as it is now
+        self.dedispersed=False
+        if 'HISTORY' in self.fits:
+            history=self.fits['HISTORY'].data
+            if history is not None and len(history) > 0 and 'DEDISP' in history.names:
+                self.dedispersed=bool(history['DEDISP'][-1])
+        if dm is None:
+            if self.dedispersed:
+                dm=0.0
+            else:
+                dm=self.table.header.get('DM',self.header.get('CHAN_DM',0.0))
+        self.dm=float(dm)
+        self.shifts=numpy.zeros(self.nchan)
+        if self.nchan > 1 and self.dm != 0:
+            freq=numpy.asarray(first['DAT_FREQ'],dtype=numpy.float64).reshape(self.nchan)
+            period=None
+            if 'PERIOD' in first.names:
+                period=float(first['PERIOD'][0])
+            if period is None or not period > 0:
+                sys.stderr.write('No PERIOD in %s, so its %d channels are summed without dedispersing\n' % (filename,
+                                                                                                         self.nchan))
+                self.dm=0.0
+            else:
+                reference=self.header.get('OBSFREQ',freq.mean())
+                # bins each channel lags the reference frequency by
+                self.shifts=kdm*self.dm*(freq**-2-reference**-2)/period*self.nbin
+        if not self.fft:
+            self.shifts=numpy.rint(self.shifts).astype(int)
+
+    ##################################################
+    def read(self, start=0, stop=None, bins=None, dtype=numpy.float32):
+        """
+        data=r.read(start=0, stop=None, bins=None, dtype=numpy.float32)
+        returns DATA*DAT_SCL+DAT_OFFS for subints [start:stop] as a (nsubint,nbin) array,
+        weighted by DAT_WTS, dedispersed and summed over channels and polarizations
+        bins can be a slice or an index array to only keep some phase bins
+        """
+        # slicing the table before picking the column means only those rows are converted
+        rows=self.table.data[start:stop]
+        n=len(rows)
+        if self.nchan == 1 and len(self.pols) == 1:
+            return self._scrunch(rows, bins, dtype)
+        keep=numpy.arange(self.nbin)
+        if bins is not None:
+            keep=keep[bins]
+        data=numpy.empty((n,len(keep)), dtype=dtype)
+        step=max(1,self.maxsamples/(len(self.pols)*self.nchan*self.nbin))
+        for i in xrange(0,n,step):
+            data[i:i+step]=self._scrunch(rows[i:i+step], keep, dtype)
+        return data
+
+    ##################################################
+    def _scrunch(self, rows, bins, dtype):
+        n=len(rows)
+        raw=rows['DATA'].reshape((n,self.npol,self.nchan,self.nbin))
+        scale=rows['DAT_SCL'].reshape((n,self.npol,self.nchan))[:,self.pols].astype(dtype)
+        offset=rows['DAT_OFFS'].reshape((n,self.npol,self.nchan))[:,self.pols].astype(dtype)
+        if self.weighted:
+            # the weights fold into the scale and offset, so each sample is only multiplied once
+            weights=rows['DAT_WTS'].reshape((n,1,self.nchan)).astype(dtype)
+            scale*=weights
+            offset*=weights
+        if self.nchan == 1 and len(self.pols) == 1:
+            # already scrunched: scale in place, without gathering or summing
+            raw=raw[:,self.pols[0],0]
+            if bins is not None:
+                raw=raw[:,bins]
+            data=raw.astype(dtype)
+            data*=scale[:,0]
+            data+=offset[:,0]
+            return data
+        if self.fft:
+            data=numpy.einsum('ipcb,ipc->icb', raw[:,self.pols].astype(dtype), scale)
+            spectrum=numpy.fft.rfft(data, axis=-1)
+            k=numpy.arange(spectrum.shape[-1])
+            ramp=numpy.exp(2j*numpy.pi*self.shifts[:,numpy.newaxis]*k/self.nbin)
+            data=numpy.fft.irfft(numpy.einsum('ick,ck->ik', spectrum, ramp), n=self.nbin, axis=-1)
+            if bins is not None:
+                data=data[:,bins]
+            data=data.astype(dtype)
+        else:
+            if self.shifts.any():
+                # each channel read from its own shifted bins, so only the bins kept are gathered
+                keep=numpy.arange(self.nbin) if bins is None else numpy.arange(self.nbin)[bins]
+                index=(keep[numpy.newaxis,:]+self.shifts[:,numpy.newaxis]) % self.nbin
+                raw=raw[:,:,numpy.arange(self.nchan)[:,numpy.newaxis],index]
+            elif bins is not None:
+                raw=raw[...,bins]
+            data=numpy.einsum('ipcb,ipc->ib', raw[:,self.pols].astype(dtype), scale)
+        data+=offset.sum(axis=(1,2))[:,numpy.newaxis]
+        return data
+
+    ##################################################
+    def close(self):
+        self.fits.close()
@@ -0,0 +1,156 @@
+"""
+On-disk cache of preprocessed pulse stacks.
+
+Each entry is a .npy file named by a hash of the input file's contents and the
+preprocessing parameters, so repeat runs with the same settings can skip
+decoding, scaling, resizing and smoothing and memory-map the result instead.
+The cache is kept under a size limit by removing the least recently used
+entries.
+
+cache=pulsecache.PulseCache()
+data=cache.cached(filename, {'size': 2, 'smooth': 1}, lambda: preprocess(filename))
+
+"""
+
+import os
+import hashlib
+import tempfile
+import numpy
+
+# bump this when the preprocessing changes so old entries are not used
+_cacheversion=6
+
+######################################################################
+def filehash(filename, nblocks=16, blocksize=2**20):
+    """
+    digest=filehash(filename, nblocks=16, blocksize=2**20)
+    hash of the file size and nblocks blocks spread evenly through the file
+    (the whole file if it is small), so huge archives are not read in full;
+    a file rewritten in place could keep its size and sampled blocks, so for
+    those the modification time and inode are part of the hash too
+    """
+    info=os.stat(filename)
+    size=info.st_size
+    h=hashlib.sha1(str(size))
+    fh=open(filename,'rb')
+    if size <= nblocks*blocksize:
+        h.update(fh.read())
+    else:
+        h.update(' %r %d' % (info.st_mtime,info.st_ino))
+        for offset in numpy.linspace(0,size-blocksize,nblocks).astype(numpy.int64):
+            fh.seek(offset)
+            h.update(fh.read(blocksize))
+    fh.close()
+    return h.hexdigest()
+
+######################################################################
+class PulseCache():
+    """
+    cache=PulseCache(directory=None, maxbytes=2**32)
+    data=cache.get(filename, params)
+    data=cache.put(filename, params, data)
+    data=cache.cached(filename, params, function)
+
+    directory defaults to $SINGLEPULSE_CACHE or ~/.cache/singlepulse
+    cached arrays come back read-only and memory-mapped
+    """
+
+    def __init__(self, directory=None, maxbytes=2**32):
+        if directory is None:
+            directory=os.environ.get('SINGLEPULSE_CACHE',
+                                     os.path.join(os.path.expanduser('~'),'.cache','singlepulse'))
+        self.directory=directory
+        self.maxbytes=maxbytes
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    ##################################################
+    def key(self, filename, params):
+        """
+        key=cache.key(filename, params)
+        params is a dictionary of everything the preprocessing depends on
+        """
+        h=hashlib.sha1('%d %s %r' % (_cacheversion,filehash(filename),sorted(params.items())))
+        return h.hexdigest()
+
+    ##################################################
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    ##################################################
+    def get(self, filename, params):
+        """
+        data=cache.get(filename, params)
+        returns None if there is no entry
+        """
+        path=self._path(self.key(filename, params))
+        if not os.path.exists(path):
+            return None
+        # the modification time marks when the entry was last used
+        os.utime(path, None)
+        return numpy.load(path, mmap_mode='r')
+
+    ##################################################
+    def put(self, filename, params, data):
+        """
+        data=cache.put(filename, params, data)
+        stores data and returns it memory-mapped from the cache
+        """
+        path=self._path(self.key(filename, params))
+        # write to a temporary file first so other processes never see half an entry
+        fd,tmpname=tempfile.mkstemp(suffix='.npy', dir=self.directory)
+        fh=os.fdopen(fd,'wb')
+        numpy.save(fh, numpy.ascontiguousarray(data))
+        fh.close()
+        os.rename(tmpname, path)
+        self.evict()
+        return numpy.load(path, mmap_mode='r')
+
+    ##################################################
+    def cached(self, filename, params, function):
+        """
+        data=cache.cached(filename, params, function)
+        returns the cached entry, or stores and returns function()
+        """
+        data=self.get(filename, params)
+        if data is None:
+            data=self.put(filename, params, function())
+        return data
+
+    ##################################################
+    def evict(self):
+        """
+        cache.evict()
+        removes least recently used entries until the cache fits in maxbytes
+        """
+        entries=[]
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            try:
+                st=os.stat(os.path.join(self.directory,name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime,st.st_size,name))
+        entries.sort()
+        total=sum([e[1] for e in entries])
+        # the newest entry is always kept, even if it is bigger than maxbytes
+        for mtime,size,name in entries[:-1]:
+            if total <= self.maxbytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory,name))
+            except OSError:
+                # another process got there first
+                pass
+            total-=size
+
+    ##################################################
+    def clear(self):
+        """
+        cache.clear()
+        removes every entry
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(self.directory,name))
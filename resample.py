@@ -0,0 +1,98 @@
+"""
+Float resampling of 2D pulse stacks.
+
+This replaces scipy.misc.imresize, which goes through an 8-bit PIL image and so
+quantizes the data to 256 levels.  Here the data stay float32, and the output
+is made a block of rows at a time, so only the input rows that a block needs
+are read (the input can be a memmap or a cached array) and the memory used is
+about that of the output.
+
+data=resample.resize(rawdata, 2.0)
+data=resample.resize(rawdata, (1000,512), interp='bicubic')
+
+"""
+
+import numpy
+
+######################################################################
+def _nearest(x):
+    return ((x >= -0.5) & (x < 0.5)).astype(numpy.float64)
+
+def _bilinear(x):
+    x=numpy.abs(x)
+    return numpy.where(x < 1, 1-x, 0)
+
+def _bicubic(x, a=-0.5):
+    x=numpy.abs(x)
+    return numpy.where(x < 1, ((a+2)*x-(a+3))*x*x+1,
+                       numpy.where(x < 2, ((x-5)*x+8)*a*x-4*a, 0))
+
+# kernel and its half-width in input pixels
+kernels={'nearest': (_nearest,0.5),
+         'bilinear': (_bilinear,1.0),
+         'bicubic': (_bicubic,2.0)}
+
+######################################################################
+def weights(nin, nout, interp='bilinear', scale=None):
+    """
+    index,weight=weights(nin, nout, interp='bilinear', scale=None)
+    for each of nout output pixels, the input pixels (nout,k) and their weights (nout,k)
+    pixel centres are lined up as in PIL; when shrinking, the bilinear and bicubic
+    kernels are widened so that every input pixel contributes (no aliasing),
+    while nearest still picks one input pixel
+    scale is output pixels per input pixel, nout/nin by default
+    """
+    if not interp in kernels:
+        raise ValueError('Unknown interpolation %s' % interp)
+    kernel,support=kernels[interp]
+    if scale is None:
+        scale=float(nout)/nin
+    stretch=1.0
+    if interp != 'nearest':
+        stretch=max(1.0/scale,1.0)
+    centre=(numpy.arange(nout)+0.5)/scale-0.5
+    k=int(numpy.ceil(support*stretch))*2+1
+    index=numpy.floor(centre).astype(int)[:,numpy.newaxis]+numpy.arange(k)-k//2
+    weight=kernel((index-centre[:,numpy.newaxis])/stretch)
+    if interp=='nearest':
+        # exactly one input pixel each, even at the half-way points
+        weight=(index==numpy.floor(centre+0.5).astype(int)[:,numpy.newaxis]).astype(numpy.float64)
+    total=weight.sum(axis=1)
+    total[total==0]=1
+    weight/=total[:,numpy.newaxis]
+    # repeat the edge pixels
+    index=numpy.clip(index,0,nin-1)
+    return index,weight.astype(numpy.float32)
+
+######################################################################
+def resize(A, size, interp='bilinear', out=None, blocksize=256):
+    """
+    data=resize(A, size, interp='bilinear', out=None, blocksize=256)
+    size is either a float (fraction of the current size) or a tuple (rows, cols)
+    a float size is the scale itself, so the first rows of the output do not depend on
+    how many rows follow them (e.g. when only the start of a pulse stack is read)
+    interp is 'nearest', 'bilinear' or 'bicubic'
+    out can be a (rows,cols) array, e.g. a memmap, to fill instead of a new float32 array
+    blocksize is the number of output rows made at once
+    """
+    m,n=A.shape
+    scale=None
+    if isinstance(size,tuple):
+        mout,nout=size
+    else:
+        mout,nout=int(m*size),int(n*size)
+        scale=float(size)
+    if out is None:
+        out=numpy.empty((mout,nout),dtype=numpy.float32)
+    rowindex,rowweight=weights(m, mout, interp, scale)
+    colindex,colweight=weights(n, nout, interp, scale)
+
+    for start in xrange(0,mout,blocksize):
+        stop=min(start+blocksize,mout)
+        index=rowindex[start:stop]
+        first,last=index.min(),index.max()+1
+        block=numpy.asarray(A[first:last],dtype=numpy.float32)
+        # along each row first, while there are the fewest rows
+        block=(block[:,colindex]*colweight).sum(axis=2)
+        out[start:stop]=(block[index-first]*rowweight[start:stop,:,numpy.newaxis]).sum(axis=1)
+    return out
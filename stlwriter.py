@@ -0,0 +1,372 @@
+"""
+Streaming binary STL output for height maps.
+
+heightmap2stl() makes the same kind of closed solid as
+stl_tools.numpy2stl(..., solid=True) (top surface, walls and base), but builds
+the facets a block of rows at a time with numpy and writes each block straight
+to disk, so the memory used does not grow with the size of the height map:
+
+stlwriter.heightmap2stl(data, 'J0034-0721.stl', scale=0.2)
+
+With max_error set, flat regions are first merged by decimate.triangulate().
+
+heightmap2tiles() cuts the same solid into tiles that each fit the printer,
+meshing each tile in its own process:
+
+stlwriter.heightmap2tiles(data, 'J0034-0721_tiles', tiles=(3,2), scale=0.2, jobs=4)
+
+"""
+
+import os
+import struct
+import numpy
+import decimate
+import instrument
+
+# one binary STL facet: normal, three vertices, attribute byte count
+facet_dtype=numpy.dtype([('normal','<f4',(3,)),
+                         ('vertices','<f4',(3,3)),
+                         ('attribute','<u2')])
+
+######################################################################
+class BinarySTLWriter():
+    """
+    w=BinarySTLWriter(filename)
+    w.write(triangles)
+    w.close()
+
+    triangles is a (ntriangles,3,3) array of vertices;
+    normals are computed from the vertex order (counter-clockwise seen from outside)
+    """
+
+    def __init__(self, filename, header='singlepulse binary STL'):
+        self.filename=filename
+        self.ntriangles=0
+        self.fh=open(filename,'wb')
+        # the number of facets is filled in by close()
+        self.fh.write(struct.pack('<80sI', header, 0))
+
+    ##################################################
+    def write(self, triangles):
+        triangles=numpy.asarray(triangles, dtype=numpy.float32).reshape((-1,3,3))
+        facets=numpy.zeros(len(triangles), dtype=facet_dtype)
+        facets['vertices']=triangles
+        normal=numpy.cross(triangles[:,1]-triangles[:,0],
+                           triangles[:,2]-triangles[:,0])
+        length=numpy.sqrt((normal**2).sum(axis=1))
+        length[length==0]=1
+        facets['normal']=normal/length[:,numpy.newaxis]
+        self.fh.write(facets.tostring())
+        self.ntriangles+=len(facets)
+
+    ##################################################
+    def close(self):
+        self.fh.seek(80)
+        self.fh.write(struct.pack('<I', self.ntriangles))
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+######################################################################
+def _fitscale(xsize, ysize, zsize, max_width, max_depth, max_height):
+    """
+    factor=_fitscale(xsize, ysize, zsize, max_width, max_depth, max_height)
+    uniform scaling that fits the model on the printer, applied in the same order as numpy2stl
+    """
+    factor=1.0
+    if xsize > max_width:
+        factor*=float(max_width)/xsize
+    if ysize*factor > max_depth:
+        factor*=float(max_depth)/(ysize*factor)
+    if zsize*factor > max_height:
+        factor*=float(max_height)/(zsize*factor)
+    return factor
+
+######################################################################
+def _perimeter(m, n):
+    """
+    i,k=_perimeter(m, n)
+    indices of the edge points of an (m,n) grid, going counter-clockwise from (0,0)
+    """
+    i=numpy.r_[numpy.arange(m-1),
+               (m-1)*numpy.ones(n-1,dtype=int),
+               numpy.arange(m-1,0,-1),
+               numpy.zeros(n-1,dtype=int)]
+    k=numpy.r_[numpy.zeros(m-1,dtype=int),
+               numpy.arange(n-1),
+               (n-1)*numpy.ones(m-1,dtype=int),
+               numpy.arange(n-1,0,-1)]
+    return i,k
+
+######################################################################
+def solidsides(top, bottom):
+    """
+    triangles=solidsides(top, bottom)
+    top is a closed (npoints,3) loop of edge vertices, counter-clockwise seen from above
+    returns the walls from the loop down to z=bottom and the base closing them off
+    """
+    a=top
+    b=numpy.roll(top,-1,axis=0)
+    abottom=a.copy()
+    abottom[:,2]=bottom
+    bbottom=b.copy()
+    bbottom[:,2]=bottom
+    walls=numpy.r_[numpy.stack([a,abottom,b],axis=1),
+                   numpy.stack([b,abottom,bbottom],axis=1)]
+    # fan from the middle so the base shares every edge with the walls
+    center=numpy.zeros_like(abottom)
+    center[:]=abottom.mean(axis=0)
+    base=numpy.stack([center,bbottom,abottom],axis=1)
+    return numpy.r_[walls,base]
+
+######################################################################
+def slabsides(top, bottom, topused, bottomused):
+    """
+    triangles=slabsides(top, bottom, topused, bottomused)
+    top and bottom are the same closed (npoints,3) loop of edge points at two heights,
+    counter-clockwise seen from above, of which the top and bottom surfaces only use
+    those marked in topused and bottomused (both must use the first point)
+    returns the walls joining them, with every used point on each side as a vertex
+    """
+    # go round once more to the first point, to close the loop
+    top=numpy.r_[top,top[:1]]
+    bottom=numpy.r_[bottom,bottom[:1]]
+    topused=numpy.r_[topused,True]
+    bottomused=numpy.r_[bottomused,True]
+    p=numpy.arange(len(top))
+    # the last used point at or before each point
+    lasttop=numpy.maximum.accumulate(numpy.where(topused,p,0))
+    lastbottom=numpy.maximum.accumulate(numpy.where(bottomused,p,0))
+    # each top edge is joined to the bottom point before it, then each bottom edge to the top point at or before it
+    t=numpy.nonzero(topused[1:])[0]+1
+    b=numpy.nonzero(bottomused[1:])[0]+1
+    return numpy.r_[numpy.stack([top[lasttop[t-1]],bottom[lastbottom[t-1]],top[t]],axis=1),
+                    numpy.stack([top[lasttop[b]],bottom[lastbottom[b-1]],bottom[b]],axis=1)]
+
+######################################################################
+def _writegrid(writer, x, y, heights, chunksize=2**18):
+    """
+    _writegrid(writer, x, y, heights, chunksize=2**18)
+    writes two triangles per cell of the grid with rows at x and columns at y, facing up;
+    heights(start, stop) gives the heights of rows start to stop-1, a block at a time
+    """
+    m,n=len(x),len(y)
+    nrows=max(chunksize/(2*(n-1)),1)
+    for start in xrange(0, m-1, nrows):
+        stop=min(start+nrows, m-1)
+        v=numpy.empty((stop+1-start,n,3), dtype=numpy.float32)
+        v[:,:,0]=x[start:stop+1,numpy.newaxis]
+        v[:,:,1]=y
+        v[:,:,2]=heights(start, stop+1)
+        this=v[:-1,:-1]
+        right=v[:-1,1:]
+        below=v[1:,:-1]
+        belowright=v[1:,1:]
+        writer.write(numpy.stack([right,this,belowright],axis=2))
+        writer.write(numpy.stack([belowright,this,below],axis=2))
+
+######################################################################
+def heightmap2stl(A, filename, scale=0.1, max_width=235., max_depth=140., max_height=150.,
+                  min_thickness_percent=0.1, chunksize=2**18, max_error=None):
+    """
+    ntriangles=heightmap2stl(A, filename, scale=0.1, max_width=235., max_depth=140., max_height=150.,
+                             min_thickness_percent=0.1, chunksize=2**18, max_error=None)
+    writes the 2D array A as a closed solid to a binary STL file
+    arguments are as for stl_tools.numpy2stl(..., solid=True)
+    chunksize is roughly the number of facets built in memory at once
+    if max_error is given, flat regions are merged into larger triangles
+    as long as the surface stays within max_error (as a fraction of the full height)
+    """
+
+    m,n=A.shape
+    if n >= m:
+        # rotate to best fit a printing platform
+        A=numpy.rot90(A, k=3)
+        m,n=n,m
+    zmin=A.min()
+    thickness=scale*(A.max()-zmin)
+    bottom=-min_thickness_percent*thickness
+    if bottom==0:
+        bottom=-1.0
+    factor=_fitscale(m-1, n-1, thickness-bottom, max_width, max_depth, max_height)
+
+    def vertices(i, k):
+        v=numpy.empty(i.shape+(3,), dtype=numpy.float32)
+        v[...,0]=(i-m/2.)*factor
+        v[...,1]=(k-n/2.)*factor
+        v[...,2]=(A[i,k]-zmin)*(scale*factor)
+        return v
+
+    i,k=_perimeter(m, n)
+    with BinarySTLWriter(filename) as writer:
+        if max_error is None:
+            _writegrid(writer, (numpy.arange(m)-m/2.)*factor, (numpy.arange(n)-n/2.)*factor,
+                       lambda start,stop: (A[start:stop]-zmin)*(scale*factor), chunksize)
+        else:
+            with instrument.stage('decimate', file=filename):
+                triangles,used=decimate.triangulate(A, max_error*(A.max()-zmin))
+            for start in xrange(0, len(triangles), chunksize):
+                t=triangles[start:start+chunksize]
+                writer.write(vertices(t[...,0],t[...,1]))
+            # the walls only need the edge points the top surface uses
+            keep=used[i,k]
+            i,k=i[keep],k[keep]
+
+        writer.write(solidsides(vertices(i,k), bottom*factor))
+    return writer.ntriangles
+
+######################################################################
+def slab2stl(top, bottom, filename, x, y, chunksize=2**18, tolerance=None):
+    """
+    ntriangles=slab2stl(top, bottom, filename, x, y, chunksize=2**18, tolerance=None)
+    writes the solid between two (m,n) height maps to a binary STL file, with rows at x
+    and columns at y; top must be above bottom everywhere
+    the bottom is merged into large triangles wherever it is flat, and so is the top
+    if tolerance (in the same units as the heights) is given
+    """
+    m,n=top.shape
+    def vertices(A, i, k):
+        v=numpy.empty(i.shape+(3,), dtype=numpy.float32)
+        v[...,0]=x[i]
+        v[...,1]=y[k]
+        v[...,2]=A[i,k]
+        return v
+
+    i,k=_perimeter(m, n)
+    with BinarySTLWriter(filename) as writer:
+        if tolerance is None:
+            _writegrid(writer, x, y, lambda start,stop: top[start:stop], chunksize)
+            topused=numpy.ones(len(i), dtype=bool)
+        else:
+            triangles,used=decimate.triangulate(top, tolerance)
+            for start in xrange(0, len(triangles), chunksize):
+                t=triangles[start:start+chunksize]
+                writer.write(vertices(top, t[...,0], t[...,1]))
+            topused=used[i,k]
+        triangles,used=decimate.triangulate(bottom, 0)
+        # the bottom faces down, so its triangles go the other way round
+        writer.write(vertices(bottom, triangles[:,::-1,0], triangles[:,::-1,1]))
+        writer.write(slabsides(vertices(top, i, k), vertices(bottom, i, k), topused, used[i,k]))
+    return writer.ntriangles
+
+######################################################################
+def _box(x0, y0, z0, x1, y1, z1):
+    # the 12 triangles of an axis-aligned box
+    top=numpy.array([[x0,y0,z1],[x1,y0,z1],[x1,y1,z1],[x0,y1,z1]], dtype=numpy.float32)
+    return numpy.r_[solidsides(top, z0),
+                    numpy.stack([top[[0,1,2]],top[[0,2,3]]])]
+
+######################################################################
+def _splits(npoints, ntiles):
+    # tile boundaries along one side; neighbouring tiles share the points at the boundary
+    return numpy.rint(numpy.linspace(0, npoints-1, ntiles+1)).astype(int)
+
+######################################################################
+def _tileworker(job):
+    # _writetile in a heightmap2tiles worker, forked with the height map and the parameters
+    return _writetile(instrument.shared['A'], job, **instrument.shared['params'])
+
+def _writetile(A, job, zmin, zscale, bottom, keydepth, factor, chunksize, tolerance):
+    """
+    ntriangles=_writetile(A, (filename, (i0,i1), (k0,k1), channels), zmin, zscale, bottom, keydepth, factor,
+                          chunksize, tolerance)
+    meshes rows i0 to i1 and columns k0 to k1 of A (inclusive), with the base raised by keydepth
+    inside each (i0,i1,k0,k1) channel; the tile is centred on the origin
+    """
+    filename,(i0,i1),(k0,k1),channels=job
+    with instrument.stage('tile', file=filename):
+        top=(numpy.asarray(A[i0:i1+1,k0:k1+1], dtype=numpy.float32)-zmin)*zscale
+        base=bottom*numpy.ones(top.shape, dtype=numpy.float32)
+        for c0,c1,d0,d1 in channels:
+            base[max(c0-i0,0):max(c1-i0+1,0),max(d0-k0,0):max(d1-k0+1,0)]=bottom+keydepth
+        x=(numpy.arange(i0,i1+1)-(i0+i1)/2.)*factor
+        y=(numpy.arange(k0,k1+1)-(k0+k1)/2.)*factor
+        return slab2stl(top, base, filename, x, y, chunksize=chunksize, tolerance=tolerance)
+
+######################################################################
+def heightmap2tiles(A, directory, tiles=(2,1), scale=0.1, max_width=235., max_depth=140., max_height=150.,
+                    min_thickness_percent=0.1, chunksize=2**18, max_error=None, min_base=4., keydepth=2.,
+                    keywidth=8., keylength=20., clearance=0.2, jobs=1):
+    """
+    filenames=heightmap2tiles(A, directory, tiles=(2,1), scale=0.1, max_width=235., max_depth=140., max_height=150.,
+                              min_thickness_percent=0.1, chunksize=2**18, max_error=None, min_base=4., keydepth=2.,
+                              keywidth=8., keylength=20., clearance=0.2, jobs=1)
+    cuts the solid heightmap2stl would make into tiles[0] tiles along its longer side and tiles[1]
+    along the shorter one, scaled so that each tile (rather than the whole) fits the printer, and
+    writes them as tile_<i>_<k>.stl in directory, each meshed by a pool of jobs processes if jobs>1
+    neighbouring tiles share the samples along their seam, so the surface carries straight across;
+    two channels cross each seam in the base, half in each tile, and keys.stl has one key to glue
+    into each (keywidth by keylength by keydepth mm, less clearance all round)
+    the base is at least min_base mm thick, whatever the scale, so the channels always fit in it
+    returns the tile files and then keys.stl
+    """
+    m,n=A.shape
+    if n >= m:
+        # rotate to best fit a printing platform, as heightmap2stl does
+        A=numpy.rot90(A, k=3)
+        m,n=n,m
+    ntiles,mtiles=tiles
+    if ntiles > m-1 or mtiles > n-1:
+        raise ValueError('Cannot cut a (%d,%d) height map into %dx%d tiles' % (m,n,ntiles,mtiles))
+    zmin=A.min()
+    thickness=scale*(A.max()-zmin)
+    bottom=-min_thickness_percent*thickness
+    if bottom==0:
+        bottom=-1.0
+    factor=_fitscale(m-1, n-1, thickness-bottom, ntiles*max_width, mtiles*max_depth, max_height)
+    # in mm from here on
+    base=max(-bottom*factor,min_base)
+    if keydepth <= clearance:
+        raise ValueError('Keys %g mm deep leave nothing once %g mm of clearance is taken off' % (keydepth,clearance))
+    if keydepth >= base:
+        raise ValueError('Key channels %g mm deep do not fit in a %g mm base' % (keydepth,base))
+
+    # channels in grid points: (i0,i1,k0,k1), inclusive
+    halflength=int(numpy.ceil(keylength/2./factor))
+    halfwidth=int(numpy.ceil(keywidth/2./factor))
+    isplits=_splits(m, ntiles)
+    ksplits=_splits(n, mtiles)
+    channels=[]
+    for i in isplits[1:-1]:
+        for k0,k1 in zip(ksplits[:-1],ksplits[1:]):
+            for k in (k0+(k1-k0)/4, k0+3*(k1-k0)/4):
+                channels.append((i-halflength,i+halflength,k-halfwidth,k+halfwidth))
+    for k in ksplits[1:-1]:
+        for i0,i1 in zip(isplits[:-1],isplits[1:]):
+            for i in (i0+(i1-i0)/4, i0+3*(i1-i0)/4):
+                channels.append((i-halfwidth,i+halfwidth,k-halflength,k+halflength))
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    work=[]
+    for a,(i0,i1) in enumerate(zip(isplits[:-1],isplits[1:])):
+        for b,(k0,k1) in enumerate(zip(ksplits[:-1],ksplits[1:])):
+            mine=[c for c in channels if c[0] <= i1 and c[1] >= i0 and c[2] <= k1 and c[3] >= k0]
+            work.append((os.path.join(directory,'tile_%d_%d.stl' % (a,b)),(i0,i1),(k0,k1),mine))
+    params={'zmin': zmin,
+            'zscale': scale*factor,
+            'bottom': -base,
+            'keydepth': keydepth,
+            'factor': factor,
+            'chunksize': chunksize,
+            'tolerance': None if max_error is None else max_error*thickness*factor}
+    if jobs > 1 and len(work) > 1:
+        # the workers are forked with the height map, so it is shared rather than copied
+        instrument.poolmap(_tileworker, work, min(jobs,len(work)), {'A': A, 'params': params})
+    else:
+        for job in work:
+            _writetile(A, job, **params)
+
+    # one key per channel, in a row
+    keyfile=os.path.join(directory,'keys.stl')
+    with BinarySTLWriter(keyfile) as writer:
+        length=2*halflength*factor-2*clearance
+        width=2*halfwidth*factor-2*clearance
+        for j in xrange(len(channels)):
+            x0=j*(width+5)
+            writer.write(_box(x0, 0, 0, x0+width, length, keydepth-clearance))
+    return [job[0] for job in work]+[keyfile]
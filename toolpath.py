@@ -0,0 +1,320 @@
+"""
+Ordering of laser paths to cut down on head travel.
+
+Paths are (npoints,2) arrays in inches. Closed paths (first point equal to the
+last) can be entered at any of their vertices; open paths at either end.
+Anything inside a closed path (like the mounting holes inside a profile
+outline) is always cut before it, so pieces do not move before they are
+finished.
+
+order,paths=toolpath.orderpaths(paths)
+print toolpath.travel(paths)
+
+mergeedges() lets pieces packed edge to edge share the cuts along their
+common straight borders, and simplify() thins out polylines to within a
+tolerance.
+
+"""
+
+import numpy
+
+######################################################################
+def isclosed(path):
+    return len(path) > 2 and numpy.allclose(path[0],path[-1])
+
+######################################################################
+def travel(paths, start=(0,0)):
+    """
+    distance=travel(paths, start=(0,0))
+    total distance moved with the laser off, going through the paths in order from start
+    """
+    if len(paths)==0:
+        return 0.0
+    entries=numpy.array([p[0] for p in paths])
+    exits=numpy.array([p[-1] for p in paths])
+    previous=numpy.r_[[start],exits[:-1]]
+    return numpy.sqrt(((entries-previous)**2).sum(axis=1)).sum()
+
+######################################################################
+def _inside(points, polygon):
+    """
+    inside=_inside(points, polygon)
+    even-odd test of (npoints,2) points against a closed polygon
+    """
+    x,y=points[:,0,numpy.newaxis],points[:,1,numpy.newaxis]
+    x1,y1=polygon[:-1,0],polygon[:-1,1]
+    x2,y2=polygon[1:,0],polygon[1:,1]
+    crosses=(y1 > y) != (y2 > y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        xcross=x1+(y-y1)*(x2-x1)/(y2-y1)
+    return ((crosses & (x < xcross)).sum(axis=1) % 2)==1
+
+######################################################################
+def parents(paths):
+    """
+    parent=parents(paths)
+    index of the smallest closed path that encloses each path (-1 if none)
+    """
+    n=len(paths)
+    parent=-numpy.ones(n, dtype=int)
+    lo=numpy.array([p.min(axis=0) for p in paths])
+    hi=numpy.array([p.max(axis=0) for p in paths])
+    area=(hi-lo).prod(axis=1)
+    for j in numpy.argsort(-area):
+        if not isclosed(paths[j]):
+            continue
+        # candidates are the other paths inside the bounding box of j
+        candidates=numpy.nonzero((lo >= lo[j]).all(axis=1) & (hi <= hi[j]).all(axis=1))[0]
+        candidates=candidates[candidates!=j]
+        if len(candidates)==0:
+            continue
+        inside=_inside(numpy.array([paths[k][0] for k in candidates]), paths[j])
+        # going from large to small, so smaller enclosing paths overwrite larger ones
+        parent[candidates[inside]]=j
+    return parent
+
+######################################################################
+def _nearestneighbor(paths, parent, start):
+    """
+    order,entry,reverse=_nearestneighbor(paths, parent, start)
+    greedy tour: always go to the nearest point where an available path can be entered
+    """
+    n=len(paths)
+    closed=numpy.array([isclosed(p) for p in paths])
+    # every vertex of a closed path is an entry; open paths only have their ends
+    points=[]
+    owner=[]
+    vertex=[]
+    for k,p in enumerate(paths):
+        if closed[k]:
+            v=numpy.arange(len(p)-1)
+        else:
+            v=numpy.array([0,len(p)-1])
+        points.append(p[v])
+        owner.append(k*numpy.ones(len(v),dtype=int))
+        vertex.append(v)
+    points=numpy.concatenate(points)
+    owner=numpy.concatenate(owner)
+    vertex=numpy.concatenate(vertex)
+
+    nchildren=numpy.bincount(parent[parent >= 0], minlength=n)
+    done=numpy.zeros(n, dtype=bool)
+    here=numpy.asarray(start, dtype=float)
+    order=[]
+    entry=[]
+    reverse=[]
+    for step in xrange(n):
+        available=~done[owner] & (nchildren[owner]==0)
+        d=((points-here)**2).sum(axis=1)
+        d[~available]=numpy.inf
+        best=numpy.argmin(d)
+        k=owner[best]
+        done[k]=True
+        if parent[k] >= 0:
+            nchildren[parent[k]]-=1
+        order.append(k)
+        entry.append(vertex[best])
+        reverse.append(not closed[k] and vertex[best] > 0)
+        p=paths[k]
+        if closed[k]:
+            here=points[best]
+        elif reverse[-1]:
+            here=p[0]
+        else:
+            here=p[-1]
+    return numpy.array(order),numpy.array(entry),numpy.array(reverse)
+
+######################################################################
+def _twoopt(entries, exits, parent, order, start, maxpasses=10):
+    """
+    order,flip=_twoopt(entries, exits, parent, order, start, maxpasses=10)
+    reverses stretches of the tour while that shortens it and keeps
+    every path ahead of the path that encloses it
+    flip marks the paths now run backwards (entry and exit swapped)
+    """
+    n=len(order)
+    order=numpy.array(order)
+    flip=numpy.zeros(n, dtype=bool)
+    for npass in xrange(maxpasses):
+        improved=False
+        for i in xrange(-1,n-2):
+            a=numpy.where(flip[order,numpy.newaxis],exits[order],entries[order])
+            b=numpy.where(flip[order,numpy.newaxis],entries[order],exits[order])
+            # the tour leaves from b[i] (or the start) into a[i+1]
+            if i < 0:
+                bi=numpy.asarray(start, dtype=float)
+            else:
+                bi=b[i]
+            j=numpy.arange(i+2,n)
+            old=numpy.sqrt(((a[i+1]-bi)**2).sum())+numpy.r_[numpy.sqrt(((a[j[:-1]+1]-b[j[:-1]])**2).sum(axis=1)),0]
+            new=numpy.sqrt(((b[j]-bi)**2).sum(axis=1))+numpy.r_[numpy.sqrt(((a[j[:-1]+1]-a[i+1])**2).sum(axis=1)),0]
+            # a reversed stretch may not hold both a path and the path enclosing it
+            position=numpy.empty(n, dtype=int)
+            position[order]=numpy.arange(n)
+            child=numpy.nonzero(parent >= 0)[0]
+            lo=numpy.minimum(position[child],position[parent[child]])
+            hi=numpy.maximum(position[child],position[parent[child]])
+            hi=hi[lo >= i+1]
+            if len(hi) > 0:
+                new[j >= hi.min()]=numpy.inf
+            gain=old-new
+            best=numpy.argmax(gain)
+            if gain[best] > 1e-9:
+                jbest=j[best]
+                flip[order[i+1:jbest+1]]=~flip[order[i+1:jbest+1]]
+                order[i+1:jbest+1]=order[i+1:jbest+1][::-1].copy()
+                improved=True
+        if not improved:
+            break
+    return order,flip
+
+######################################################################
+def orderpaths(paths, start=(0,0), twoopt=True, closedfirst=False):
+    """
+    order,newpaths=orderpaths(paths, start=(0,0), twoopt=True, closedfirst=False)
+    orders the paths with a nearest-neighbour tour from start, improved by 2-opt
+    closed paths are rotated to start at the vertex nearest the head, and open
+    paths may be reversed, so newpaths holds the paths as they should be cut
+    with closedfirst, all closed paths are cut before any open ones
+    (for pieces whose outlines were split up by mergeedges)
+    """
+    paths=[numpy.asarray(p, dtype=float) for p in paths]
+    if len(paths)==0:
+        return numpy.array([],dtype=int),[]
+    if closedfirst:
+        closed=numpy.nonzero([isclosed(p) for p in paths])[0]
+        opened=numpy.nonzero([not isclosed(p) for p in paths])[0]
+        order1,new1=orderpaths([paths[k] for k in closed], start=start, twoopt=twoopt)
+        if len(new1) > 0:
+            start=new1[-1][-1]
+        order2,new2=orderpaths([paths[k] for k in opened], start=start, twoopt=twoopt)
+        return numpy.r_[closed[order1],opened[order2]].astype(int),new1+new2
+    parent=parents(paths)
+    order,entry,reverse=_nearestneighbor(paths, parent, start)
+
+    # fix where each path is entered, then let 2-opt reverse stretches of the tour
+    entered=[None]*len(paths)
+    for k,v,r in zip(order,entry,reverse):
+        p=paths[k]
+        if isclosed(p):
+            entered[k]=numpy.r_[p[v:-1],p[:v+1]]
+        elif r:
+            entered[k]=p[::-1]
+        else:
+            entered[k]=p
+    if twoopt and len(paths) > 2:
+        entries=numpy.array([p[0] for p in entered])
+        exits=numpy.array([p[-1] for p in entered])
+        order,flip=_twoopt(entries, exits, parent, order, start)
+        for k in numpy.nonzero(flip)[0]:
+            entered[k]=entered[k][::-1]
+    return order,[entered[k] for k in order]
+
+######################################################################
+def pathlength(paths):
+    """
+    length=pathlength(paths)
+    total length of the paths (the distance cut)
+    """
+    return sum([numpy.sqrt((numpy.diff(p,axis=0)**2).sum(axis=1)).sum() for p in paths])
+
+######################################################################
+def _union(lo, hi, tolerance):
+    """
+    lo,hi=_union(lo, hi, tolerance)
+    merges overlapping or touching intervals
+    """
+    order=numpy.argsort(lo)
+    lo,hi=lo[order],hi[order]
+    reach=numpy.maximum.accumulate(hi)
+    start=numpy.r_[True,lo[1:] > reach[:-1]+tolerance]
+    group=numpy.cumsum(start)-1
+    newhi=numpy.zeros(group[-1]+1)
+    numpy.maximum.at(newhi, group, hi)
+    return lo[start],newhi
+
+######################################################################
+def mergeedges(paths, tolerance=1e-6):
+    """
+    newpaths=mergeedges(paths, tolerance=1e-6)
+    cuts shared straight edges only once: every horizontal or vertical segment
+    is merged with the segments it overlaps on the same line, so pieces packed
+    edge to edge share their common borders
+    closed paths with no straight edges (like holes) are kept as they are;
+    the rest of each path is kept as open polylines between its straight segments
+    """
+    paths=[numpy.asarray(p, dtype=float) for p in paths]
+    kept=[]
+    curves=[]
+    lines={0: ([],[],[]), 1: ([],[],[])}
+    for p in paths:
+        d=numpy.diff(p,axis=0)
+        length=numpy.abs(d).max(axis=1)
+        vertical=(numpy.abs(d[:,0]) <= tolerance) & (length > tolerance)
+        horizontal=(numpy.abs(d[:,1]) <= tolerance) & (length > tolerance)
+        straight=vertical | horizontal
+        if not straight.any():
+            kept.append(p)
+            continue
+        for axis,mask in ((0,vertical),(1,horizontal)):
+            # a vertical line is fixed in x and runs in y, and the other way round
+            position,lo,hi=lines[axis]
+            position.append(p[:-1][mask,axis])
+            lo.append(numpy.minimum(p[:-1][mask,1-axis],p[1:][mask,1-axis]))
+            hi.append(numpy.maximum(p[:-1][mask,1-axis],p[1:][mask,1-axis]))
+        # stretches between the straight segments stay as they are
+        bends=numpy.nonzero(~straight)[0]
+        if len(bends)==0:
+            continue
+        breaks=numpy.nonzero(numpy.diff(bends) > 1)[0]
+        for first,last in zip(numpy.r_[0,breaks+1],numpy.r_[breaks,len(bends)-1]):
+            curves.append(p[bends[first]:bends[last]+2])
+
+    merged=[]
+    for axis in (0,1):
+        position,lo,hi=[numpy.concatenate(x) for x in lines[axis]]
+        if len(position)==0:
+            continue
+        key=numpy.round(position/tolerance).astype(numpy.int64)
+        for k in numpy.unique(key):
+            same=key==k
+            x=position[same].mean()
+            for a,b in zip(*_union(lo[same],hi[same],tolerance)):
+                if axis==0:
+                    merged.append(numpy.array([[x,a],[x,b]]))
+                else:
+                    merged.append(numpy.array([[a,x],[b,x]]))
+    return kept+curves+merged
+
+######################################################################
+def simplify(path, tolerance):
+    """
+    newpath=simplify(path, tolerance)
+    Douglas-Peucker simplification: drops vertices while the polyline
+    stays within tolerance of the original; the ends are always kept
+    """
+    path=numpy.asarray(path, dtype=float)
+    n=len(path)
+    if n < 3 or tolerance <= 0:
+        return path
+    keep=numpy.zeros(n, dtype=bool)
+    keep[0]=keep[-1]=True
+    stack=[(0,n-1)]
+    while len(stack) > 0:
+        i,j=stack.pop()
+        if j <= i+1:
+            continue
+        chord=path[j]-path[i]
+        points=path[i+1:j]-path[i]
+        length=numpy.sqrt((chord**2).sum())
+        if length==0:
+            # a closed loop: use the distance from the end point
+            d=numpy.sqrt((points**2).sum(axis=1))
+        else:
+            d=numpy.abs(chord[0]*points[:,1]-chord[1]*points[:,0])/length
+        k=numpy.argmax(d)
+        if d[k] > tolerance:
+            keep[i+1+k]=True
+            stack.append((i,i+1+k))
+            stack.append((i+1+k,j))
+    return path[keep]
@@ -0,0 +1,63 @@
+"""
+Lengths on the sheet.
+
+Everything on a LaserCutSheet is laid out in inches.  These convert lengths in
+other units, as plain numbers or whole numpy arrays at once, or as strings
+with the unit on the end:
+
+width=units.toinches(600, 'mm')
+xy=units.convert(xy, 'inch', 'pt')
+height=units.toinches('45cm')
+
+"""
+
+import re
+import numpy
+
+# inches per unit
+perinch={'in': 1.0,
+         'inch': 1.0,
+         'inches': 1.0,
+         'mm': 1/25.4,
+         'cm': 1/2.54,
+         'm': 1/0.0254,
+         'pt': 1/72.,
+         'points': 1/72.}
+
+_length=re.compile(r'^\s*([-+0-9.eE]+)\s*([a-zA-Z]*)\s*$')
+
+######################################################################
+def scale(unit):
+    """
+    factor=scale(unit)
+    inches per unit
+    """
+    try:
+        return perinch[unit.lower()]
+    except KeyError:
+        raise ValueError('Unknown unit %s (expected one of %s)' % (unit,', '.join(sorted(perinch.keys()))))
+
+######################################################################
+def toinches(value, unit='inch'):
+    """
+    inches=toinches(value, unit='inch')
+    value is a number, an array or a string such as '600mm' (whose unit wins over unit)
+    """
+    if isinstance(value,basestring):
+        match=_length.match(value)
+        if match is None:
+            raise ValueError('Cannot read length %s' % value)
+        number,suffix=match.groups()
+        if len(suffix) > 0:
+            unit=suffix
+        return float(number)*scale(unit)
+    if unit in ('in','inch','inches'):
+        return value
+    return numpy.multiply(value,scale(unit))
+
+######################################################################
+def convert(value, fromunit, tounit):
+    """
+    value=convert(value, fromunit, tounit)
+    """
+    return numpy.multiply(value,scale(fromunit)/scale(tounit))
@@ -0,0 +1,241 @@
+"""
+Direct SVG, DXF and PDF output for laser-cut sheets.
+
+These write the pieces of a LaserCutSheet straight from their numpy coordinates
+(in inches), without going through matplotlib. The elements are the sheet's
+drawing commands: (color, method, args, kwargs) with method one of 'plot'
+(x, y), 'lines' (a sequence of (npoints,2) polylines), 'fill_between'
+(x, y1, y2) or 'text' (x, y, string).
+
+vectorwriter.write('sheet.dxf', 24, 48, sheet.elements)
+
+Lines are written as hairlines; DXF puts each color on its own layer.
+"""
+
+import os
+import numpy
+
+# hairline width in inches, as wanted by the laser drivers
+hairline=0.001
+
+# named colors, as used by matplotlib
+namedcolors={'black': (0,0,0),
+             'white': (255,255,255),
+             'red': (255,0,0),
+             'green': (0,128,0),
+             'lime': (0,255,0),
+             'blue': (0,0,255),
+             'cyan': (0,255,255),
+             'magenta': (255,0,255),
+             'yellow': (255,255,0),
+             'orange': (255,165,0),
+             'k': (0,0,0),
+             'w': (255,255,255),
+             'r': (255,0,0),
+             'g': (0,128,0),
+             'b': (0,0,255),
+             'c': (0,191,191),
+             'm': (191,0,191),
+             'y': (191,191,0)}
+
+# AutoCAD color index for DXF
+aci={1: (255,0,0),
+     2: (255,255,0),
+     3: (0,255,0),
+     4: (0,255,255),
+     5: (0,0,255),
+     6: (255,0,255),
+     7: (0,0,0),
+     30: (255,127,0)}
+
+######################################################################
+def rgb(color):
+    """
+    r,g,b=rgb(color)
+    color is a name or #rrggbb
+    """
+    if color.startswith('#'):
+        return tuple([int(color[i:i+2],16) for i in (1,3,5)])
+    return namedcolors[color.lower()]
+
+######################################################################
+def colorindex(color):
+    """
+    index=colorindex(color)
+    nearest AutoCAD color index
+    """
+    c=numpy.array(rgb(color))
+    return min(aci.keys(), key=lambda i: ((numpy.array(aci[i])-c)**2).sum())
+
+######################################################################
+def layername(color):
+    return color.lstrip('#')
+
+######################################################################
+def _text(s):
+    # no mathtext outside matplotlib
+    return s.replace('$','')
+
+######################################################################
+def primitives(width, height, elements, color=None, guide=True):
+    """
+    for kind,c,data in primitives(width, height, elements, color=None, guide=True):
+    turns the sheet's drawing commands into
+      ('line', color, (npoints,2) array)
+      ('fill', color, (npoints,2) array)
+      ('text', color, (x, y, string, fontsize, horizontalalignment, verticalalignment))
+    keeping only the given color if there is one
+    """
+    if guide:
+        yield 'line','k',numpy.array([[0,0],[width,0],[width,height],[0,height],[0,0]],dtype=float)
+    for c,method,args,kwargs in elements:
+        if color is not None and c!=color:
+            continue
+        if method=='plot':
+            yield 'line',c,numpy.c_[args[0],args[1]].astype(float)
+        elif method=='lines':
+            for xy in args[0]:
+                yield 'line',c,numpy.asarray(xy,dtype=float)
+        elif method=='fill_between':
+            x=numpy.asarray(args[0],dtype=float)
+            y1=args[1]*numpy.ones(len(x))
+            y2=args[2]*numpy.ones(len(x))
+            yield 'fill',c,numpy.r_[numpy.c_[x,y1],numpy.c_[x,y2][::-1]]
+        elif method=='text':
+            yield 'text',c,(args[0],args[1],_text(args[2]),
+                            kwargs.get('fontsize',10),
+                            kwargs.get('horizontalalignment',kwargs.get('ha','left')),
+                            kwargs.get('verticalalignment',kwargs.get('va','baseline')))
+        else:
+            raise ValueError('Cannot write %s elements' % method)
+
+######################################################################
+def _textorigin(x, y, s, fontsize, ha, va):
+    """
+    x,y=_textorigin(x, y, s, fontsize, ha, va)
+    left end of the baseline, in inches
+    no font metrics here, so this uses typical Helvetica proportions
+    """
+    x=x-{'left': 0, 'center': 0.5, 'right': 1.0}.get(ha,0)*0.55*fontsize*len(s)/72.
+    y=y-{'top': 0.75, 'center': 0.35, 'bottom': -0.2}.get(va,0)*fontsize/72.
+    return x,y
+
+######################################################################
+def _points(xy, fmt):
+    # one C-level formatting call per path rather than one per vertex
+    return (fmt*len(xy)) % tuple(xy.ravel())
+
+######################################################################
+def writesvg(filename, width, height, elements, color=None, guide=True):
+    """
+    writesvg(filename, width, height, elements, color=None, guide=True)
+    """
+    out=['<?xml version="1.0" encoding="UTF-8"?>\n',
+         '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="%gin" height="%gin" viewBox="0 0 %g %g">\n' % (width,height,width,height)]
+    for kind,c,data in primitives(width, height, elements, color=color, guide=guide):
+        hexcolor='#%02x%02x%02x' % rgb(c)
+        if kind=='text':
+            x,y,s,fontsize,ha,va=data
+            x,y=_textorigin(x,y,s,fontsize,ha,va)
+            s=s.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;')
+            out.append('<text x="%.4f" y="%.4f" font-family="Helvetica" font-size="%.4f" fill="%s">%s</text>\n' % (x,height-y,fontsize/72.,hexcolor,s))
+            continue
+        xy=data.copy()
+        xy[:,1]=height-xy[:,1]
+        if kind=='line':
+            out.append('<polyline fill="none" stroke="%s" stroke-width="%g" points="%s"/>\n' % (hexcolor,hairline,_points(xy,'%.4f,%.4f ')))
+        else:
+            out.append('<polygon fill="%s" stroke="none" points="%s"/>\n' % (hexcolor,_points(xy,'%.4f,%.4f ')))
+    out.append('</svg>\n')
+    fh=open(filename,'w')
+    fh.write(''.join(out))
+    fh.close()
+
+######################################################################
+def writedxf(filename, width, height, elements, color=None, guide=True):
+    """
+    writedxf(filename, width, height, elements, color=None, guide=True)
+    writes an R12 DXF in inches; fills are written as their closed outlines
+    """
+    out=['0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n0\nENDSEC\n',
+         '0\nSECTION\n2\nENTITIES\n']
+    halign={'left': 0, 'center': 1, 'right': 2}
+    valign={'baseline': 0, 'bottom': 1, 'center': 2, 'top': 3}
+    for kind,c,data in primitives(width, height, elements, color=color, guide=guide):
+        layer=layername(c)
+        index=colorindex(c)
+        if kind=='text':
+            x,y,s,fontsize,ha,va=data
+            out.append('0\nTEXT\n8\n%s\n62\n%d\n10\n%.4f\n20\n%.4f\n30\n0.0\n40\n%.4f\n1\n%s\n72\n%d\n73\n%d\n11\n%.4f\n21\n%.4f\n31\n0.0\n' % (layer,index,x,y,fontsize/72.,s,halign.get(ha,0),valign.get(va,0),x,y))
+            continue
+        if kind=='fill':
+            closed=True
+        elif numpy.allclose(data[0],data[-1]):
+            # closed paths repeat their first point; DXF uses a flag instead
+            closed=True
+            data=data[:-1]
+        else:
+            closed=False
+        out.append('0\nPOLYLINE\n8\n%s\n62\n%d\n66\n1\n70\n%d\n10\n0.0\n20\n0.0\n30\n0.0\n' % (layer,index,1 if closed else 0))
+        out.append(_points(data,'0\nVERTEX\n8\n'+layer+'\n10\n%.4f\n20\n%.4f\n30\n0.0\n'))
+        out.append('0\nSEQEND\n8\n%s\n' % layer)
+    out.append('0\nENDSEC\n0\nEOF\n')
+    fh=open(filename,'w')
+    fh.write(''.join(out))
+    fh.close()
+
+######################################################################
+def writepdf(filename, width, height, elements, color=None, guide=True):
+    """
+    writepdf(filename, width, height, elements, color=None, guide=True)
+    writes a single-page PDF the size of the sheet, with text in Helvetica
+    """
+    stream=['%.4f w\n1 J 1 j\n' % (hairline*72)]
+    for kind,c,data in primitives(width, height, elements, color=color, guide=guide):
+        r,g,b=[v/255. for v in rgb(c)]
+        if kind=='text':
+            x,y,s,fontsize,ha,va=data
+            x,y=_textorigin(x,y,s,fontsize,ha,va)
+            s=s.replace('\\','\\\\').replace('(','\\(').replace(')','\\)')
+            stream.append('BT\n%.3f %.3f %.3f rg\n/F1 %.2f Tf\n%.3f %.3f Td\n(%s) Tj\nET\n' % (r,g,b,fontsize,72*x,72*y,s))
+            continue
+        xy=72*data
+        path='%.3f %.3f m\n' % tuple(xy[0]) + _points(xy[1:],'%.3f %.3f l\n')
+        if kind=='line':
+            stream.append('%.3f %.3f %.3f RG\n%sS\n' % (r,g,b,path))
+        else:
+            stream.append('%.3f %.3f %.3f rg\n%sf\n' % (r,g,b,path))
+    stream=''.join(stream)
+
+    objects=['<< /Type /Catalog /Pages 2 0 R >>',
+             '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+             '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>' % (72*width,72*height),
+             '<< /Length %d >>\nstream\n%s\nendstream' % (len(stream),stream),
+             '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    out='%PDF-1.4\n'
+    offsets=[]
+    for i,o in enumerate(objects):
+        offsets.append(len(out))
+        out+='%d 0 obj\n%s\nendobj\n' % (i+1,o)
+    xref=len(out)
+    out+='xref\n0 %d\n0000000000 65535 f \n' % (len(objects)+1)
+    out+=''.join(['%010d 00000 n \n' % o for o in offsets])
+    out+='trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects)+1,xref)
+    fh=open(filename,'wb')
+    fh.write(out)
+    fh.close()
+
+writers={'.svg': writesvg,
+         '.dxf': writedxf,
+         '.pdf': writepdf}
+
+######################################################################
+def write(filename, width, height, elements, color=None, guide=True):
+    """
+    write(filename, width, height, elements, color=None, guide=True)
+    picks the format from the file extension (.svg, .dxf or .pdf)
+    """
+    extension=os.path.splitext(filename)[1].lower()
+    if not extension in writers:
+        raise ValueError('Unknown vector format %s' % extension)
+    writers[extension](filename, width, height, elements, color=color, guide=guide)